@@ -1,30 +1,38 @@
 import os
+import atexit
+import hmac
 import logging
-from logging.handlers import TimedRotatingFileHandler
-from models import init_db, create_superuser, User, BlogPost, Comment
+import queue
+from logging.handlers import TimedRotatingFileHandler, QueueHandler, QueueListener
+from models import (init_db, create_superuser, on_change, get_content_version, highlight_html,
+                    User, BlogPost, Comment, Outbox)
+from db import db
+from i18n import catalog, LANGUAGES, DEFAULT_LANGUAGE
+from cache import page_cache, feed_cache, change_log, ChangeLog
+from mailer import mail_worker
+from uploads import save_upload, shutdown_pool, srcset
+from assets import asset_manifest
+from ratelimit import login_limiter
+from sessions import make_session_interface
+from metrics import metrics
 from sanic import Sanic, response
 from sanic.request import Request
 from sanic.response import html, redirect, json
 from sanic.exceptions import NotFound
 from sanic_ext import Extend
-from sanic_session import Session, InMemorySessionInterface
-from jinja2 import Environment, FileSystemLoader, select_autoescape
-from email.message import EmailMessage
+from sanic_session import Session
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, select_autoescape
+from markupsafe import Markup
 from email_validator import validate_email, EmailNotValidError
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request as Request
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from base64 import urlsafe_b64encode
-from dotenv import load_dotenv
-import aiofiles
-from datetime import datetime
-import json as std_json
-from config import REQUEST_MAX_SIZE
-
-# Завантаження змінних оточення
-load_dotenv()
+from datetime import datetime, timezone
+from email.utils import format_datetime as format_http_date, parsedate_to_datetime
+import hashlib
+import math
+import signal
+from config import (REQUEST_MAX_SIZE, PAGE_MAX_AGE, STATIC_MAX_AGE, STATIC_IMMUTABLE_MAX_AGE,
+                    HOST, PORT, WORKERS, BACKLOG, KEEP_ALIVE_TIMEOUT, ACCESS_LOG, INSPECTOR,
+                    TEMPLATE_CACHE_DIR, TEMPLATE_AUTO_RELOAD, TEMPLATE_STREAM_BUFFER, ADMIN_PAGE_SIZE,
+                    METRICS_TOKEN, SITE_URL, FEED_SIZE, REAL_IP_HEADER, USER_LOOKUP_KEY)
 
 # Налаштування логування
 logger = logging.getLogger('sanic_app')
@@ -43,41 +51,78 @@ formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(messag
 file_handler.setFormatter(formatter)
 console_handler.setFormatter(formatter)
 
-# Додаємо обробники до логгера
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
+# Обробник логгера лише кладе запис у чергу; у файл і консоль пише окремий потік,
+# тож цикл подій не чекає на диск
+log_queue = queue.SimpleQueue()
+log_listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+logger.addHandler(QueueHandler(log_queue))
+log_listener.start()
+atexit.register(log_listener.stop)
 
 app = Sanic("BlogApp")
+# Час і кількість рядків кожного запиту моделей (див. metrics.py)
+db.query_observer = metrics.observe_query
 app.config.REQUEST_MAX_SIZE = REQUEST_MAX_SIZE
+app.config.KEEP_ALIVE_TIMEOUT = KEEP_ALIVE_TIMEOUT
+app.config.ACCESS_LOG = ACCESS_LOG
+app.config.INSPECTOR = INSPECTOR
+app.config.REAL_IP_HEADER = REAL_IP_HEADER or None
 Extend(app)
 
-session = Session(app, interface=InMemorySessionInterface())
+session_interface = make_session_interface()
+session = Session(app, interface=session_interface)
 
+os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
 env = Environment(
     loader=FileSystemLoader('templates'),
-    autoescape=select_autoescape(['html', 'xml'])
+    autoescape=select_autoescape(['html', 'xml']),
+    bytecode_cache=FileSystemBytecodeCache(TEMPLATE_CACHE_DIR),
+    auto_reload=TEMPLATE_AUTO_RELOAD,
+    enable_async=True
 )
 
+
+def load_templates():
+    # Компілює всі шаблони наперед: байткод лягає в TEMPLATE_CACHE_DIR,
+    # а готові шаблони — в кеш середовища, тож перший запит їх не компілює
+    for name in env.list_templates(extensions=['html', 'xml']):
+        env.get_template(name)
+
 # --- Middleware Section ---
 
 
 @app.middleware('request')
 async def detect_language(request: Request):
+    # Статичним файлам переклади не потрібні
+    if request.path.startswith('/static/'):
+        return
     lang = request.cookies.get('lang')
     if not lang:
-        lang = request.headers.get('Accept-Language', 'uk').split(',')[0]
+        lang = request.headers.get('Accept-Language', DEFAULT_LANGUAGE).split(',')[0]
     if '-' in lang:
         lang = lang.split('-')[0]
-    if lang not in ['uk', 'en']:
-        lang = 'uk'
+    if lang not in LANGUAGES:
+        lang = DEFAULT_LANGUAGE
+    sync_changes()
     request.ctx.lang = lang
-    with open(f'translations/{lang}.json', 'r', encoding='utf-8') as f:
-        request.ctx.translations = std_json.load(f)
+    request.ctx.translations = catalog.get(lang)
+
+
+@app.signal('http.lifecycle.handle')
+async def start_request_metrics(request):
+    metrics.start_request()
+
+
+@app.signal('http.lifecycle.response')
+async def finish_request_metrics(request, response):
+    # Мітка — шаблон маршруту (/post/<post_id:int>), а не конкретна адреса
+    route = f"/{request.route.path}" if request.route else 'unmatched'
+    metrics.finish_request(route, request.method, response.status)
 
 
 @app.route('/set_language/<lang>')
 async def set_language(request, lang):
-    if lang not in ['uk', 'en']:
+    if lang not in LANGUAGES:
         return response.json({'error': 'Language not supported'}, status=400)
     response_obj = response.redirect('/')
     response_obj.cookies['lang'] = lang
@@ -86,7 +131,7 @@ async def set_language(request, lang):
 
 
 def static_url(filename):
-    return f"/static/{filename}"
+    return asset_manifest.url(filename)
 
 
 def format_datetime(value, format='%d/%m/%Y'):
@@ -95,70 +140,287 @@ def format_datetime(value, format='%d/%m/%Y'):
     return value.strftime(format)
 
 
+def isoformat_utc(value):
+    # Дата з бази (локальний час сервера) у форматі RFC 3339 для Atom і sitemap
+    return datetime.fromisoformat(value).astimezone(timezone.utc).replace(microsecond=0).isoformat()
+
+
+def highlight(value):
+    # Текст уже екранований, лишаються тільки теги <mark> навколо знайдених слів
+    return Markup(highlight_html(value))
+
+
 env.filters['format_datetime'] = format_datetime
+env.filters['isoformat_utc'] = isoformat_utc
+env.filters['highlight'] = highlight
 env.filters['static_url'] = static_url
-app.static('/static', './static')
-
-
-async def save_file(file, upload_dir='static/uploads'):
-    # Переконайтеся, що файл має ім'я
-    if not file.name:
-        raise ValueError("The uploaded file does not have a name")
-    if not os.path.exists(upload_dir):
-        os.makedirs(upload_dir)
-    file_path = os.path.join(upload_dir, file.name)
-    # Переконайтеся, що file_path не є директорією
-    if os.path.isdir(file_path):
-        raise IsADirectoryError(f"Path {file_path} is a directory")
-    async with aiofiles.open(file_path, 'wb') as f:
-        await f.write(file.body)
-    return f'/static/uploads/{file.name}'
-
-
-def get_credentials():
-    SCOPES = ['https://www.googleapis.com/auth/gmail.send']
-    creds = None
-    if os.path.exists('token.json'):
-        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
-            creds = flow.run_local_server(port=8080)
-        with open('token.json', 'w') as token:
-            token.write(creds.to_json())
-    return creds
+env.filters['srcset'] = srcset
+
+
+@app.route('/static/<filename:path>', methods=['GET', 'HEAD'])
+async def static_files(request, filename):
+    # Віддає заздалегідь стиснену версію файлу (.br/.gz), якщо клієнт її приймає
+    resolved = asset_manifest.resolve(filename, request.headers.get('Accept-Encoding', ''))
+    if resolved is None:
+        raise NotFound(f"Requested URL {request.path} not found")
+    path, encoding, mime_type = resolved
+    if asset_manifest.is_immutable(filename):
+        cache_control = f'public, max-age={STATIC_IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        cache_control = f'public, max-age={STATIC_MAX_AGE}'
+    # response.file() ставить власний cache-control через setdefault, тому ключ у нижньому регістрі
+    headers = {'cache-control': cache_control, 'Vary': 'Accept-Encoding'}
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return await response.file(path, mime_type=mime_type, headers=headers, request_headers=request.headers)
+
+
+def content_fingerprint():
+    # Хеш шаблонів і перекладів: нова версія сайту дає нові ETag
+    digest = hashlib.sha1()
+    for directory in ('templates', 'translations'):
+        for name in sorted(os.listdir(directory)):
+            with open(os.path.join(directory, name), 'rb') as f:
+                digest.update(name.encode())
+                digest.update(f.read())
+    # Нова збірка статики змінює хешовані посилання у сторінках
+    digest.update(repr(sorted(asset_manifest.files.items())).encode())
+    return digest.hexdigest()
+
+
+def reload_translations():
+    error = catalog.reload()
+    if error:
+        logger.error(f"Translations reload failed: {error}")
+        return False
+    app.ctx.content_fingerprint = content_fingerprint()
+    # Закешовані сторінки відрендерені зі старими рядками
+    page_cache.clear()
+    feed_cache.clear()
+    logger.info("Translations reloaded")
+    return True
+
+
+def handle_sighup():
+    # Сигнал отримує один воркер; решта перечитають переклади з журналу змін (див. sync_changes)
+    if reload_translations():
+        change_log.publish('translations_reloaded', 0)
 
 
-def create_message(sender, to, subject, message_text):
-    message = EmailMessage()
-    message.set_content(message_text)
-    message["To"] = to
-    message["From"] = sender
-    message["Subject"] = subject
-    raw_message = urlsafe_b64encode(message.as_bytes()).decode()
-    return {'raw': raw_message}
+@app.before_server_start
+async def setup_translations(app, loop):
+    catalog.load()
+    asset_manifest.load()
+    load_templates()
+    app.ctx.content_fingerprint = content_fingerprint()
+    # kill -HUP <pid воркера> перечитує файли перекладів у всіх воркерах без перезапуску сервера
+    if hasattr(signal, 'SIGHUP'):
+        loop.add_signal_handler(signal.SIGHUP, handle_sighup)
+
+
+@app.main_process_start
+async def prepare_db(app, loop):
+    # Міграції і суперкористувач — один раз у головному процесі, до старту воркерів
+    if not USER_LOOKUP_KEY:
+        raise RuntimeError("USER_LOOKUP_KEY is not set; generate one with: "
+                           "python -c \"import secrets; print(secrets.token_hex(32))\"")
+    await db.open()
+    try:
+        await init_db()
+        await create_superuser()
+    finally:
+        await db.close()
+    load_templates()
+    metrics.reset_snapshots()
+    # Журнал змін, спільний для всіх воркерів (див. sync_changes)
+    app.shared_ctx.change_log = ChangeLog.allocate()
 
 
-def send_message(service, user_id, message):
-    try:
-        message = service.users().messages().send(userId=user_id, body=message).execute()
-        logger.info(f"Message Id: {message['id']}")
-        return message
-    except HttpError as error:
-        logger.error(f"An error occurred: {error}")
-        return None
+@app.main_process_ready
+async def setup_reload_signal(app, loop):
+    # kill -USR1 <pid головного процесу> перезапускає воркерів без простою:
+    # нові воркери стартують раніше, ніж зупиняються старі
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1,
+                      lambda *_: app.manager.monitor_publisher.send('__ALL_PROCESSES__::STARTUP_FIRST'))
 
 
 @app.before_server_start
 async def setup_db(app, loop):
-    await init_db()
-    await create_superuser()
+    await db.open()
+    change_log.attach(getattr(app.shared_ctx, 'change_log', None))
+
+
+@app.after_server_start
+async def start_mail_worker(app, loop):
+    mail_worker.start()
+
+
+@app.before_server_stop
+async def stop_mail_worker(app, loop):
+    await mail_worker.stop()
+
+
+@app.after_server_start
+async def start_session_sweeper(app, loop):
+    if hasattr(session_interface, 'start_sweeper'):
+        session_interface.start_sweeper()
+
+
+@app.before_server_stop
+async def stop_session_sweeper(app, loop):
+    if hasattr(session_interface, 'stop_sweeper'):
+        await session_interface.stop_sweeper()
+
+
+@app.after_server_start
+async def start_metrics_flusher(app, loop):
+    metrics.start_flusher()
+
+
+@app.before_server_stop
+async def stop_metrics_flusher(app, loop):
+    await metrics.stop_flusher()
+
+
+@app.after_server_stop
+async def close_db(app, loop):
+    shutdown_pool()
+    await db.close()
 
 
 # --- User's Side Section ---
 
+# Обмеження протоколу sitemaps.org на кількість адрес в одному файлі
+SITEMAP_MAX_URLS = 50000
+# Скільки сусідніх з поточною сторінок показує пагінатор
+PAGER_RADIUS = 2
+
+
+def make_validators(cache_key, version):
+    etag_source = repr((app.ctx.content_fingerprint, cache_key, tuple(version)))
+    etag = '"' + hashlib.sha1(etag_source.encode()).hexdigest()[:20] + '"'
+    timestamps = [value for value in (version.posts_updated_at, version.comments_created_at) if value]
+    last_modified = None
+    if timestamps:
+        # Дати в базі зберігаються в локальному часі сервера
+        modified = datetime.fromisoformat(max(timestamps)).astimezone(timezone.utc)
+        last_modified = format_http_date(modified.replace(microsecond=0), usegmt=True)
+    return etag, last_modified
+
+
+def is_not_modified(request, etag, last_modified):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        # Слабке порівняння (RFC 9110): W/"..." від проксі, що стиснув відповідь, теж збігається
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return etag in [tag[2:] if tag.startswith('W/') else tag for tag in tags] or if_none_match.strip() == '*'
+    if_modified_since = request.headers.get('If-Modified-Since')
+    if if_modified_since and last_modified:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def cache_headers(etag, last_modified):
+    headers = {
+        'ETag': etag,
+        'Cache-Control': f'public, max-age={PAGE_MAX_AGE}',
+        'Vary': 'Cookie, Accept-Language',
+    }
+    if last_modified:
+        headers['Last-Modified'] = last_modified
+    return headers
+
+
+def sync_changes():
+    # Зміни з інших воркерів скидають тут ті самі сторінки, що й у воркері, який їх зробив.
+    # Якщо частину журналу вже перезаписано, невідомо, що змінилося, — скидається все
+    changes = change_log.pending()
+    if changes is None:
+        page_cache.clear()
+        feed_cache.clear()
+        changes = [('translations_reloaded', 0)]
+    for event, post_id in changes:
+        if event == 'translations_reloaded':
+            reload_translations()
+        else:
+            invalidate_pages(event, post_id)
+
+
+async def stream_html(request, chunks, headers=None):
+    # Відправляє HTML частинами, поки шаблон ще рендериться; повертає зібраний HTML.
+    # Відповідь уже надіслана, тож обробник після цього нічого не повертає
+    response_obj = await request.respond(headers=headers, content_type='text/html; charset=utf-8')
+    parts, buffer, size = [], [], 0
+    async for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= TEMPLATE_STREAM_BUFFER:
+            parts.append(''.join(buffer))
+            await response_obj.send(parts[-1])
+            buffer, size = [], 0
+    parts.append(''.join(buffer))
+    await response_obj.send(parts[-1])
+    await response_obj.eof()
+    return ''.join(parts)
+
+
+async def stream_page(request, cache_key, chunks, etag, last_modified):
+    # Зібраний після відправлення HTML потрапляє в кеш
+    body = await stream_html(request, chunks, cache_headers(etag, last_modified))
+    page_cache.set(cache_key, body, etag, last_modified)
+
+
+async def cached_page(request, cache_key, render, post_id=None, cache=page_cache, comments=True,
+                      content_type='text/html; charset=utf-8'):
+    # Віддає сторінку з кешу або рендерить її; 304 повертається ще до рендерингу.
+    # render() повертає HTML-рядок, асинхронний генератор частин HTML (відправляється
+    # потоком, див. stream_page) або готову відповідь (наприклад, редирект), яка не кешується.
+    # comments=False — документ не показує коментарів, і вони не змінюють його валідаторів
+    entry = cache.get(cache_key)
+    if entry is None:
+        version = await get_content_version(post_id, comments)
+        etag, last_modified = make_validators(cache_key, version)
+        if is_not_modified(request, etag, last_modified):
+            return response.empty(status=304, headers=cache_headers(etag, last_modified))
+        body = await render()
+        if hasattr(body, '__aiter__'):
+            return await stream_page(request, cache_key, body, etag, last_modified)
+        if not isinstance(body, str):
+            return body
+        entry = cache.set(cache_key, body, etag, last_modified)
+    body, etag, last_modified = entry
+    headers = cache_headers(etag, last_modified)
+    if is_not_modified(request, etag, last_modified):
+        return response.empty(status=304, headers=headers)
+    return response.raw(body, headers=headers, content_type=content_type)
+
+
+@on_change
+def invalidate_pages(event, post_id):
+    # Скидаємо лише ті сторінки, на яких видно змінені дані
+    page_cache.invalidate('posts')
+    if event.startswith('comment_'):
+        page_cache.invalidate('post', post_id)
+        return
+    page_cache.invalidate('index')
+    page_cache.invalidate('search')
+    feed_cache.clear()
+    if event == 'post_updated':
+        page_cache.invalidate('post', post_id)
+    else:
+        # Додавання чи видалення поста змінює навігацію сусідніх постів
+        page_cache.invalidate('post')
+
+
+@on_change
+def notify_workers(event, post_id):
+    # Інші воркери прочитають зміну з журналу в sync_changes
+    change_log.publish(event, int(post_id))
+
 
 @app.route("/", methods=["GET", "POST"])
 async def index(request):
@@ -168,87 +430,178 @@ async def index(request):
         email = form.get('email')
         subject = form.get('subject')
         message = form.get('message')
-        # Валідація електронної пошти
+        # Валідація електронної пошти (перевірка домену робить DNS-запит, тому поза циклом подій)
         try:
-            v = validate_email(email)
+            v = await request.app.loop.run_in_executor(None, validate_email, email)
             email = v["email"]
         except EmailNotValidError as e:
             return json({"error": str(e)}, status=400)
-        # Отримання OAuth2 токену
-        credentials = get_credentials()
-        # Створення сервісу Gmail API
-        service = build('gmail', 'v1', credentials=credentials)
-        # Створення повідомлення
-        email_message = create_message(os.getenv('EMAIL_USER'), os.getenv('RECIPIENT_EMAIL'), subject, f"Name: {name}\nEmail: {email}\n\nMessage:\n{message}")
-        # Відправка повідомлення
-        send_message(service, 'me', email_message)
-        logger.info(f"Email sent from {email} with subject '{subject}'")
+        # Лист лише ставиться в чергу, відправляє його фоновий воркер
+        await Outbox.enqueue(os.getenv('EMAIL_USER'), os.getenv('RECIPIENT_EMAIL'), subject, f"Name: {name}\nEmail: {email}\n\nMessage:\n{message}")
+        mail_worker.wake()
+        logger.info(f"Email queued from {email} with subject '{subject}'")
         return redirect("/")
-    latest_posts = await BlogPost.get_latest_posts(2)
-    template = env.get_template('index.html')
-    return html(template.render(latest_posts=latest_posts, request=request))
+
+    async def render():
+        latest_posts = await BlogPost.get_latest_posts(2)
+        template = env.get_template('index.html')
+        return await template.render_async(latest_posts=latest_posts, request=request)
+
+    return await cached_page(request, ('index', request.ctx.lang), render)
+
+
+def page_number(request):
+    # Номер сторінки з ?page=; некоректне значення дає першу сторінку
+    try:
+        return max(1, int(request.args.get('page', 1)))
+    except ValueError:
+        return 1
+
+
+def page_window(current, total, radius=PAGER_RADIUS):
+    # Номери сторінок для пагінатора: перша, остання і сусідні з поточною; None — пропуск.
+    # Кількість посилань не залежить від кількості сторінок
+    pages = {1, total} | set(range(max(1, current - radius), min(total, current + radius) + 1))
+    window, previous = [], 0
+    for number in sorted(pages):
+        if number - previous > 1:
+            window.append(None)
+        window.append(number)
+        previous = number
+    return window
+
+
+env.globals['page_window'] = page_window
 
 
 @app.route("/posts")
 async def posts(request):
     tag = request.args.get('tag')
-    page = int(request.args.get('page', 1))
+    page = page_number(request)
     posts_per_page = 2
-    if tag:
-        posts = await BlogPost.get_by_tag(tag)
-    else:
-        posts = await BlogPost.get_all()
-    total_posts = len(posts)
-    total_pages = (total_posts + posts_per_page - 1) // posts_per_page
-    start = (page - 1) * posts_per_page
-    end = start + posts_per_page
-    paginated_posts = posts[start:end]
-    # Отримуємо кількість коментарів для кожного поста
-    posts_with_comments = []
-    for post in paginated_posts:
-        post_id = post[0]
-        post_with_comments = list(post)  # Перетворюємо кортеж на список
-        post_with_comments.append(await Comment.get_comment_count_by_post_id(post_id))
-        posts_with_comments.append(post_with_comments)
-    needpagination = total_posts > posts_per_page
-    template = env.get_template('posts.html')
-    return html(
-        template.render(
+
+    async def render():
+        posts_with_comments, total_posts = await BlogPost.get_page(tag, page, posts_per_page)
+        total_pages = (total_posts + posts_per_page - 1) // posts_per_page
+        tag_cloud = await BlogPost.get_tag_counts()
+        needpagination = total_posts > posts_per_page
+        template = env.get_template('posts.html')
+        return await template.render_async(
             posts=posts_with_comments,
             selected_tag=tag,
+            tag_cloud=tag_cloud,
             total_pages=total_pages,
             current_page=page,
             pagination=needpagination,
             request=request
         )
-    )
+
+    return await cached_page(request, ('posts', request.ctx.lang, tag, page), render)
+
+
+@app.route("/search")
+async def search(request):
+    query = request.args.get('q', '').strip()
+    page = page_number(request)
+    results_per_page = 10
+
+    async def render():
+        results, total = await BlogPost.search(query, request.ctx.lang, page, results_per_page)
+        total_pages = (total + results_per_page - 1) // results_per_page
+        template = env.get_template('search.html')
+        return await template.render_async(
+            query=query,
+            results=results,
+            total=total,
+            total_pages=total_pages,
+            current_page=page,
+            pagination=total > results_per_page,
+            request=request
+        )
+
+    return await cached_page(request, ('search', request.ctx.lang, query, page), render)
 
 
-@app.route("/post/<post_id>", methods=["GET", "POST"])
+@app.route("/post/<post_id:int>", methods=["GET", "POST"])
 async def post_detail(request, post_id):
-    post = await BlogPost.get_by_id(post_id)
-    if not post:
-        return redirect("/posts")
     if request.method == "POST":
+        if not await BlogPost.exists(post_id):
+            return redirect("/posts")
         form = request.form
         name = form.get('name')
         message = form.get('message')
         parent_id = form.get('parent_id')
         await Comment.create(post_id, name, message, parent_id)
         return redirect(f"/post/{post_id}")
-    comments = await Comment.get_by_post_id(post_id)
-    prev_post, next_post = await BlogPost.get_navigation_posts(post_id)
-    template = env.get_template('post_detail.html')
-    return html(
-        template.render(
+
+    async def render():
+        post = await BlogPost.get_detail(post_id, request.ctx.lang)
+        if not post:
+            return redirect("/posts")
+        comments, comment_count = await Comment.get_tree(post_id)
+        prev_post, next_post = await BlogPost.get_navigation_posts(post_id)
+        template = env.get_template('post_detail.html')
+        return template.generate_async(
             post=post,
             comments=comments,
+            comment_count=comment_count,
             prev_post=prev_post,
             next_post=next_post,
             request=request
-            )
         )
 
+    return await cached_page(request, ('post', request.ctx.lang, post_id), render, post_id)
+
+
+def site_url(request):
+    return SITE_URL or f"{request.scheme}://{request.host}"
+
+
+@app.route("/feed.xml")
+async def feed(request):
+    # Atom-стрічка найновіших постів; мова — параметр lang, а не кукі, щоб у кожної стрічки була своя адреса
+    lang = request.args.get('lang', DEFAULT_LANGUAGE)
+    if lang not in LANGUAGES:
+        lang = DEFAULT_LANGUAGE
+    base_url = site_url(request)
+
+    async def render():
+        entries = await BlogPost.get_feed(lang, FEED_SIZE)
+        updated = max((entry.updated_at or entry.publication_date for entry in entries),
+                      default=datetime.now().isoformat())
+        template = env.get_template('feed.xml')
+        return await template.render_async(entries=entries, updated=updated, lang=lang, base_url=base_url,
+                                            translations=catalog.get(lang))
+
+    return await cached_page(request, ('feed', lang, base_url), render, cache=feed_cache, comments=False,
+                             content_type='application/atom+xml; charset=utf-8')
+
+
+@app.route("/sitemap.xml")
+async def sitemap(request):
+    # Один файл вміщує до SITEMAP_MAX_URLS адрес; для більшої кількості постів
+    # /sitemap.xml стає індексом, що посилається на /sitemap.xml?page=N
+    page = request.args.get('page')
+    if page is not None and not page.isdigit():
+        raise NotFound(f"Requested URL {request.path} not found")
+    base_url = site_url(request)
+
+    async def render():
+        total = await BlogPost.count()
+        pages = max(1, math.ceil(total / SITEMAP_MAX_URLS))
+        if page is None and pages > 1:
+            template = env.get_template('sitemap_index.xml')
+            return await template.render_async(pages=pages, base_url=base_url)
+        number = int(page or 1)
+        if not 1 <= number <= pages:
+            raise NotFound(f"Requested URL {request.path} not found")
+        entries = await BlogPost.get_sitemap_page(number, SITEMAP_MAX_URLS)
+        template = env.get_template('sitemap.xml')
+        return await template.render_async(entries=entries, base_url=base_url, include_pages=number == 1)
+
+    return await cached_page(request, ('sitemap', page, base_url), render, cache=feed_cache, comments=False,
+                             content_type='application/xml; charset=utf-8')
+
 
 # --- End User's Section ---
 # --- Start Admin Section ---
@@ -257,10 +610,18 @@ async def post_detail(request, post_id):
 @app.route("/login", methods=["GET", "POST"])
 async def login(request):
     if request.method == "POST":
+        # За проксі адресу клієнта дає remote_addr із заголовка REAL_IP_HEADER (див. config.py)
+        client_ip = request.remote_addr or request.ip
+        retry_after = await login_limiter.hit(client_ip)
+        if retry_after:
+            logger.warning(f"Too many login attempts from {client_ip}")
+            return json({"error": "Too many login attempts"}, status=429,
+                        headers={'Retry-After': str(math.ceil(retry_after))})
         form = request.form
         username = form.get('username')
         password = form.get('password')
         if await User.authenticate(username, password):
+            await login_limiter.reset(client_ip)
             response = redirect("/dashboard")
             request.ctx.session['user'] = username
             logger.info(f"User {username} logged in")
@@ -269,7 +630,7 @@ async def login(request):
             logger.warning("Invalid login attempt")
             return json({"error": "Invalid credentials"}, status=401)
     template = env.get_template('login.html')
-    return html(template.render())
+    return html(await template.render_async())
 
 @app.route("/create_post", methods=["GET", "POST"])
 async def create_post(request):
@@ -285,17 +646,17 @@ async def create_post(request):
         # Обробка завантаження зображення
         if 'main_image' in request.files and request.files.get('main_image').name:
             main_image_file = request.files.get('main_image')
-            main_image_url = await save_file(main_image_file)
+            main_image_url, main_image_variants = await save_upload(main_image_file)
         else:
-            main_image_url = None
+            main_image_url, main_image_variants = None, None
         # Створення нового блог-посту
-        await BlogPost.create(title_uk, title_en, main_image_url, text_uk, text_en, tags)
+        await BlogPost.create(title_uk, title_en, main_image_url, text_uk, text_en, tags, main_image_variants)
         return redirect("/dashboard")
     template = env.get_template('create_post.html')
-    return html(template.render())
+    return html(await template.render_async())
 
 
-@app.route("/edit_post/<post_id>", methods=["GET", "POST"])
+@app.route("/edit_post/<post_id:int>", methods=["GET", "POST"])
 async def edit_post(request, post_id):
     if 'user' not in request.ctx.session:
         return redirect("/login")
@@ -312,10 +673,11 @@ async def edit_post(request, post_id):
         # Обробка завантаження зображення
         if 'main_image' in request.files and request.files.get('main_image').name:
             main_image_file = request.files.get('main_image')
-            main_image_url = await save_file(main_image_file)
+            main_image_url, main_image_variants = await save_upload(main_image_file)
         else:
-            logger.info(post[3])
-            main_image_url = post[3]  # Якщо зображення не завантажене, залишити старе
+            logger.info(post.main_image)
+            # Якщо зображення не завантажене, залишити старе разом з його копіями
+            main_image_url, main_image_variants = post.main_image, post.main_image_variants
         await BlogPost.update(
             post_id,
             title_uk,
@@ -323,14 +685,41 @@ async def edit_post(request, post_id):
             main_image_url,
             text_uk,
             text_en,
-            tags
+            tags,
+            main_image_variants
             )
         return redirect("/dashboard")
     template = env.get_template('edit_post.html')
-    return html(template.render(post=post))
+    return html(await template.render_async(post=post))
+
+
+def parse_cursor(value):
+    # Ключ сторінки в адмінці: "<id>,<дата>" останнього рядка попередньої сторінки
+    if not value:
+        return None
+    row_id, _, date = value.partition(',')
+    try:
+        return date, int(row_id)
+    except ValueError:
+        return None
+
+
+def format_cursor(key):
+    return f"{key[1]},{key[0]}" if key else None
+
+
+def selected_ids(request):
+    # id позначених рядків з форми масових дій
+    ids = []
+    for value in request.form.getlist('ids') or ():
+        try:
+            ids.append(int(value))
+        except ValueError:
+            pass
+    return ids
 
 
-@app.route("/delete_post/<post_id>", methods=["POST"])
+@app.route("/delete_post/<post_id:int>", methods=["POST"])
 async def delete_post(request, post_id):
     if 'user' not in request.ctx.session:
         return redirect("/login")
@@ -338,25 +727,63 @@ async def delete_post(request, post_id):
     return redirect("/dashboard")
 
 
+@app.route("/delete_posts", methods=["POST"])
+async def delete_posts(request):
+    if 'user' not in request.ctx.session:
+        return redirect("/login")
+    ids = selected_ids(request)
+    if ids:
+        deleted = await BlogPost.delete_many(ids)
+        logger.info(f"Deleted {len(deleted)} posts")
+    return redirect("/dashboard")
+
+
 @app.route("/dashboard")
 async def dashboard(request):
     if 'user' not in request.ctx.session:
         return redirect("/login")
-    posts = await BlogPost.get_all()
+    cursor = parse_cursor(request.args.get('before'))
+    posts, next_key = await BlogPost.get_admin_page(cursor, ADMIN_PAGE_SIZE)
     template = env.get_template('dashboard.html')
-    return html(template.render(posts=posts))
+    await stream_html(request, template.generate_async(
+        posts=posts,
+        first_page=cursor is None,
+        next_cursor=format_cursor(next_key)
+    ))
 
 
 @app.route("/admin/comments")
 async def admin_comments(request):
     if 'user' not in request.ctx.session:
         return redirect("/login")
-    comments = await Comment.get_all()
+    cursor = parse_cursor(request.args.get('before'))
+    comments, next_key = await Comment.get_admin_page(cursor, ADMIN_PAGE_SIZE)
     template = env.get_template('admin_comments.html')
-    return html(template.render(comments=comments))
+    await stream_html(request, template.generate_async(
+        comments=comments,
+        first_page=cursor is None,
+        next_cursor=format_cursor(next_key)
+    ))
+
+
+@app.route("/admin/cache")
+async def admin_cache(request):
+    if 'user' not in request.ctx.session:
+        return redirect("/login")
+    return json(page_cache.stats())
+
 
+@app.route("/metrics")
+async def metrics_endpoint(request):
+    # Для Prometheus — заголовок Authorization: Bearer <METRICS_TOKEN>; в браузері — сесія адміна
+    authorization = request.headers.get('Authorization', '')
+    token_ok = bool(METRICS_TOKEN) and hmac.compare_digest(authorization.encode(), f"Bearer {METRICS_TOKEN}".encode())
+    if not token_ok and 'user' not in request.ctx.session:
+        return json({"error": "Unauthorized"}, status=401)
+    return response.text(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
-@app.route("/admin/comments/delete/<comment_id>", methods=["POST"])
+
+@app.route("/admin/comments/delete/<comment_id:int>", methods=["POST"])
 async def delete_comment(request, comment_id):
     if 'user' not in request.ctx.session:
         return redirect("/login")
@@ -364,19 +791,31 @@ async def delete_comment(request, comment_id):
     return redirect("/admin/comments")
 
 
+@app.route("/admin/comments/delete", methods=["POST"])
+async def delete_comments(request):
+    if 'user' not in request.ctx.session:
+        return redirect("/login")
+    ids = selected_ids(request)
+    if ids:
+        deleted = await Comment.delete_many(ids)
+        logger.info(f"Deleted {deleted} comments")
+    return redirect("/admin/comments")
+
+
 # Обробник помилок 404
 @app.exception(NotFound)
 async def handle_404(request, exception):
     logger.error(f"404 Not Found: {request.url}")
     template = env.get_template('404.html')
-    return html(template.render(), status=404)
+    return html(await template.render_async(), status=404)
 
 # Загальний обробник помилок
 @app.exception(Exception)
 async def handle_exceptions(request, exception):
     logger.error(f"Exception: {exception}")
     template = env.get_template('error.html')
-    return html(template.render(), status=500)
+    return html(await template.render_async(), status=500)
 
 if __name__ == '__main__':
-    app.run(host="0.0.0.0", port=8000)
+    # Кількість воркерів, backlog, keep-alive і журнал доступу — у config.py (змінні оточення)
+    app.run(host=HOST, port=PORT, workers=WORKERS, backlog=BACKLOG, access_log=ACCESS_LOG)
@@ -0,0 +1,162 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import sys
+from config import STATIC_DIR, STATIC_BUILD_DIR, UPLOAD_DIR
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Збірка статичних файлів: копіює static/ у STATIC_BUILD_DIR, додає до кожного
+# файлу копію з хешем вмісту в імені (css/styles.3f2a1b4c5d.css) і поруч
+# стиснені версії .br/.gz для текстових форматів. manifest.json зіставляє
+# вихідні імена з хешованими. Оригінальні імена лишаються, бо CSS і CKEditor
+# підвантажують файли за відносними шляхами.
+# Запуск: python assets.py
+
+MANIFEST_NAME = 'manifest.json'
+COMPRESSIBLE_TYPES = {'.css', '.js', '.svg', '.html', '.txt', '.json', '.xml', '.md', '.ttf', '.eot', '.ico'}
+SKIP_NAMES = {'.DS_Store'}
+# Кодування в порядку переваги і розширення файлів, у яких вони лежать
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def hashed_name(path, digest):
+    root, ext = os.path.splitext(path)
+    return f'{root}.{digest}{ext}'
+
+
+def compress(data):
+    # Стиснена версія зберігається, лише якщо вона помітно менша за оригінал
+    variants = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(data, quality=11)
+    return {
+        encoding: variants[encoding]
+        for encoding, _ in ENCODINGS
+        if encoding in variants and len(variants[encoding]) < len(data) * 0.9
+    }
+
+
+def accepted_encodings(header):
+    # Кодування з Accept-Encoding, крім явно заборонених через q=0
+    accepted = set()
+    for item in header.lower().split(','):
+        encoding, _, params = item.partition(';')
+        _, _, quality = params.partition('q=')
+        try:
+            if quality and float(quality) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(encoding.strip())
+    return accepted
+
+
+def _source_files(source):
+    uploads = os.path.relpath(UPLOAD_DIR, source)
+    for dirpath, dirnames, filenames in os.walk(source):
+        rel_dir = os.path.relpath(dirpath, source)
+        # Завантаження змінюються під час роботи сайту і вже адресуються вмістом
+        dirnames[:] = sorted(d for d in dirnames if os.path.normpath(os.path.join(rel_dir, d)) != uploads)
+        for name in sorted(filenames):
+            if name not in SKIP_NAMES:
+                yield os.path.normpath(os.path.join(rel_dir, name)).replace(os.sep, '/')
+
+
+def build(source=STATIC_DIR, target=STATIC_BUILD_DIR):
+    # Збирає у тимчасову теку і підміняє попередню збірку одним перейменуванням
+    tmp_target = f'{target}.tmp'
+    shutil.rmtree(tmp_target, ignore_errors=True)
+    manifest = {'files': {}, 'encodings': {}}
+    for rel_path in _source_files(source):
+        with open(os.path.join(source, rel_path), 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()[:10]
+        hashed = hashed_name(rel_path, digest)
+        manifest['files'][rel_path] = hashed
+        compressed = compress(data) if os.path.splitext(rel_path)[1].lower() in COMPRESSIBLE_TYPES else {}
+        for name in (rel_path, hashed):
+            path = os.path.join(tmp_target, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+            for encoding, suffix in ENCODINGS:
+                if encoding in compressed:
+                    with open(path + suffix, 'wb') as f:
+                        f.write(compressed[encoding])
+            if compressed:
+                manifest['encodings'][name] = list(compressed)
+    with open(os.path.join(tmp_target, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+    old_target = f'{target}.old'
+    if os.path.exists(target):
+        os.replace(target, old_target)
+    os.replace(tmp_target, target)
+    shutil.rmtree(old_target, ignore_errors=True)
+    return manifest
+
+
+class AssetManifest:
+    # Маніфест зібраної статики, що читається при старті воркера.
+    # Без збірки (локальна розробка) файли віддаються з static/ як є.
+    def __init__(self, source=STATIC_DIR, build_dir=STATIC_BUILD_DIR):
+        self.source = source
+        self.build_dir = build_dir
+        self.files = {}
+        self.hashed = frozenset()
+        self.built = frozenset()
+        self.encodings = {}
+
+    def load(self):
+        try:
+            with open(os.path.join(self.build_dir, MANIFEST_NAME)) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            manifest = {'files': {}, 'encodings': {}}
+        self.files = manifest['files']
+        self.hashed = frozenset(self.files.values())
+        self.built = frozenset(self.files) | self.hashed
+        self.encodings = {name: tuple(encodings) for name, encodings in manifest['encodings'].items()}
+
+    def url(self, filename):
+        return f"/static/{self.files.get(filename, filename)}"
+
+    def is_immutable(self, filename):
+        # Хешовані імена й завантаження (іменуються SHA-256) ніколи не змінюють вмісту
+        return filename in self.hashed or filename.startswith(os.path.relpath(UPLOAD_DIR, self.source) + '/')
+
+    def resolve(self, filename, accept_encoding=''):
+        # Повертає (шлях до файлу, Content-Encoding або None, MIME-тип) чи None
+        filename = os.path.normpath(filename).replace(os.sep, '/')
+        if filename.startswith(('../', '/')) or filename == '..':
+            return None
+        mime_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        if filename in self.built:
+            path = os.path.join(self.build_dir, filename)
+            available = self.encodings.get(filename, ())
+            accepted = accepted_encodings(accept_encoding) if available else ()
+            for encoding, suffix in ENCODINGS:
+                if encoding in available and encoding in accepted:
+                    return path + suffix, encoding, mime_type
+            return path, None, mime_type
+        path = os.path.join(self.source, filename)
+        if os.path.isfile(path):
+            return path, None, mime_type
+        return None
+
+
+asset_manifest = AssetManifest()
+
+
+if __name__ == '__main__':
+    result = build(*sys.argv[1:3])
+    compressed = sum(len(encodings) for encodings in result['encodings'].values())
+    print(f"{len(result['files'])} files fingerprinted, {compressed} compressed variants written"
+          + ("" if brotli else " (brotli not installed, .br skipped)"))
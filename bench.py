@@ -0,0 +1,420 @@
+import argparse
+import json
+import os
+import platform
+import random
+import signal
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+
+# Простий навантажувальний тест: рахує запити/сек для публічних маршрутів
+# запущеного сервера (python app.py), щоб порівнювати зміни "до" і "після".
+# --suite — відтворюваний прогін на синтетичних базах кількох розмірів
+# зі звітом у JSON (див. run_suite).
+
+_local = threading.local()
+
+
+def get_session():
+    if not hasattr(_local, 'session'):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def hit(url):
+    resp = get_session().get(url, allow_redirects=False)
+    return resp.status_code
+
+
+def run(url, total, concurrency):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        statuses = list(pool.map(hit, [url] * total))
+    elapsed = time.perf_counter() - started
+    errors = sum(1 for status in statuses if status >= 400)
+    return total / elapsed, errors
+
+
+def bench_middleware(iterations):
+    # Мікробенчмарк накладних витрат request-middleware без мережі і сервера
+    import asyncio
+    from sanic.compat import Header
+    from sanic.request import Request
+    from app import app, detect_language
+    from i18n import catalog
+
+    catalog.load()
+
+    async def measure(path):
+        headers = Header({'Accept-Language': 'en-US,en;q=0.9'})
+        request = Request(path.encode(), headers, '1.1', 'GET', None, app)
+        started = time.perf_counter()
+        for _ in range(iterations):
+            await detect_language(request)
+        return (time.perf_counter() - started) / iterations * 1e6
+
+    for path in ['/posts', '/static/css/styles.css']:
+        per_request = asyncio.run(measure(path))
+        print(f"detect_language {path:<24} {per_request:8.2f} us/request")
+
+
+def bench_comments(sizes, repeats=5):
+    # Побудова дерева коментарів і рендеринг сторінки поста для N коментарів
+    import asyncio
+    from types import SimpleNamespace
+    from app import env, load_templates
+    from i18n import catalog
+    from models import CommentRow, PostDetail, build_comment_tree
+
+    catalog.load()
+    load_templates()
+    template = env.get_template('post_detail.html')
+    request = SimpleNamespace(ctx=SimpleNamespace(lang='uk', translations=catalog.get('uk')))
+    now = datetime.now()
+    post = PostDetail(1, 'Заголовок', None, now.isoformat(), '<p>текст</p>', 'news', None)
+
+    async def render(comments, count):
+        parts = [chunk async for chunk in template.generate_async(
+            post=post, comments=comments, comment_count=count, prev_post=None, next_post=None, request=request)]
+        return ''.join(parts)
+
+    random.seed(1)
+    for size in sizes:
+        # Кожен десятий коментар — верхнього рівня, решта — відповіді на випадкові попередні
+        rows = []
+        for i in range(1, size + 1):
+            parent_id = None if i % 10 == 1 else random.randint(max(1, i - 50), i - 1)
+            rows.append(CommentRow(i, 1, f'name {i}', f'message {i}', parent_id, (now + timedelta(seconds=i)).isoformat()))
+        started = time.perf_counter()
+        for _ in range(repeats):
+            roots = build_comment_tree(rows)
+        build_ms = (time.perf_counter() - started) / repeats * 1000
+        started = time.perf_counter()
+        for _ in range(repeats):
+            page = asyncio.run(render(roots, len(rows)))
+        render_ms = (time.perf_counter() - started) / repeats * 1000
+        print(f"{size:>6} comments  tree {build_ms:8.2f} ms  render {render_ms:9.2f} ms  page {len(page) // 1024} KB")
+
+
+# --- Набір бенчмарків (--suite) ---
+
+WORDS_UK = ('україна', 'технології', 'новини', 'армія', 'волонтери', 'допомога', 'розробка', 'сервер',
+            'дані', 'мережа', 'безпека', 'проєкт', 'команда', 'громада', 'освіта', 'енергія', 'місто',
+            'історія', 'культура', 'наука', 'дрон', 'зв\'язок', 'ремонт', 'звіт', 'план')
+WORDS_EN = ('ukraine', 'technology', 'news', 'army', 'volunteers', 'help', 'development', 'server',
+            'data', 'network', 'security', 'project', 'team', 'community', 'education', 'energy', 'city',
+            'history', 'culture', 'science', 'drone', 'signal', 'repair', 'report', 'plan')
+TAGS = tuple(f'tag{i}' for i in range(40))
+DEFAULT_SCALES = (100, 10000, 100000)
+
+
+def _sentence(rnd, words, size):
+    return ' '.join(rnd.choice(words) for _ in range(size)).capitalize() + '.'
+
+
+def _body(rnd, words, paragraphs=3):
+    return ''.join(f'<p>{" ".join(_sentence(rnd, words, 12) for _ in range(2))}</p>' for _ in range(paragraphs))
+
+
+def _init_schema(path):
+    # Схема — тими ж міграціями, що й у застосунку
+    import asyncio
+    from db import db
+    from models import init_db
+
+    async def migrate():
+        db.path = path
+        await db.open()
+        try:
+            await init_db()
+        finally:
+            await db.close()
+
+    asyncio.run(migrate())
+
+
+def seed_database(path, posts, comments_per_post=5, seed=1):
+    # Синтетичні двомовні пости з тегами (частота тегів спадає, як у живому блозі)
+    # і дерева коментарів. Однаковий seed дає однакову базу.
+    from models import html_to_text
+
+    rnd = random.Random(seed)
+    tmp_path = f'{path}.tmp'
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(tmp_path + suffix):
+            os.remove(tmp_path + suffix)
+    _init_schema(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    start = datetime(2020, 1, 1)
+    tag_weights = [1 / (i + 1) for i in range(len(TAGS))]
+    comment_id = 0
+    batch = 1000
+    for first in range(1, posts + 1, batch):
+        post_rows, tag_rows, fts_rows, comment_rows = [], [], [], []
+        for post_id in range(first, min(first + batch, posts + 1)):
+            published = (start + timedelta(minutes=post_id * 7)).isoformat()
+            title_uk, title_en = _sentence(rnd, WORDS_UK, 5), _sentence(rnd, WORDS_EN, 5)
+            text_uk, text_en = _body(rnd, WORDS_UK), _body(rnd, WORDS_EN)
+            tags = sorted(set(rnd.choices(TAGS, tag_weights, k=rnd.randint(1, 3))))
+            post_rows.append((post_id, title_uk, title_en, None, published, text_uk, text_en,
+                              ' '.join(tags), published, None))
+            tag_rows.extend((post_id, tag) for tag in tags)
+            fts_rows.append((post_id, title_uk, title_en, html_to_text(text_uk), html_to_text(text_en)))
+            # Кожен третій коментар — відповідь на один з попередніх у цьому пості
+            post_comments = []
+            for i in range(rnd.randint(0, comments_per_post * 2)):
+                comment_id += 1
+                parent_id = rnd.choice(post_comments) if post_comments and rnd.random() < 0.33 else None
+                post_comments.append(comment_id)
+                created = (start + timedelta(minutes=post_id * 7 + i + 1)).isoformat()
+                comment_rows.append((comment_id, post_id, f'Reader {comment_id % 97}',
+                                     _sentence(rnd, WORDS_EN, 10), parent_id, created))
+        with conn:
+            conn.executemany('''
+                INSERT INTO blogposts (id, title_uk, title_en, main_image, publication_date, text_uk, text_en,
+                                       tags, updated_at, main_image_variants)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', post_rows)
+            conn.executemany('INSERT INTO post_tags (post_id, tag) VALUES (?, ?)', tag_rows)
+            conn.executemany('INSERT INTO posts_fts (rowid, title_uk, title_en, body_uk, body_en) VALUES (?, ?, ?, ?, ?)',
+                             fts_rows)
+            conn.executemany('''
+                INSERT INTO comments (id, post_id, name, message, parent_id, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', comment_rows)
+    conn.execute('PRAGMA optimize')
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+    os.replace(tmp_path, path)
+    return {'posts': posts, 'comments': comment_id}
+
+
+def _process_tree(pid):
+    # pid і всі його нащадки (Linux, /proc)
+    children = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, ()))
+    return tree
+
+
+def peak_rss_kb(pid):
+    # Найбільший пік RSS (VmHWM) серед процесів сервера; None, якщо /proc недоступний
+    peaks = []
+    for process in _process_tree(pid) if os.path.isdir('/proc') else ():
+        try:
+            with open(f'/proc/{process}/status') as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        peaks.append(int(line.split()[1]))
+        except OSError:
+            continue
+    return max(peaks) if peaks else None
+
+
+def start_server(db_path, port, workers, workdir):
+    env = dict(os.environ, DB_PATH=db_path, PORT=str(port), HOST='127.0.0.1', WORKERS=str(workers),
+               MAIL_TRANSPORT='fake', ACCESS_LOG='false', METRICS_DIR=os.path.join(workdir, 'metrics'),
+               USER_LOOKUP_KEY=os.environ.get('USER_LOOKUP_KEY') or 'bench')
+    log = open(os.path.join(workdir, f'server-{port}.log'), 'w')
+    process = subprocess.Popen([sys.executable, 'app.py'], env=env, stdout=log, stderr=subprocess.STDOUT,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'server exited with code {process.returncode}, see {log.name}')
+        try:
+            requests.get(base_url + '/', timeout=30)
+            return process, base_url
+        except requests.RequestException:
+            time.sleep(0.2)
+    stop_server(process)
+    raise RuntimeError('server did not start in 120 s')
+
+
+def stop_server(process):
+    tree = _process_tree(process.pid) if os.path.isdir('/proc') else [process.pid]
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    # Воркери, що не завершилися разом із головним процесом
+    for pid in tree[1:]:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+
+def _percentile(sorted_values, percent):
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(percent / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def measure(requests_list, concurrency):
+    # requests_list — [(метод, url, дані форми)]; повертає статистику латентності й пропускної здатності
+    def send(item):
+        method, url, data = item
+        started = time.perf_counter()
+        try:
+            resp = get_session().request(method, url, data=data, allow_redirects=False, timeout=60)
+            ok = resp.status_code < 400
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(send, requests_list))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(latency * 1000 for latency, _ in results)
+    return {
+        'requests': len(results),
+        'errors': sum(1 for _, ok in results if not ok),
+        'throughput_rps': round(len(results) / elapsed, 1),
+        'latency_ms': {
+            'p50': round(_percentile(latencies, 50), 2),
+            'p95': round(_percentile(latencies, 95), 2),
+            'p99': round(_percentile(latencies, 99), 2),
+            'mean': round(sum(latencies) / len(latencies), 2),
+            'max': round(latencies[-1], 2),
+        },
+    }
+
+
+def route_workloads(base_url, posts, total, seed=1):
+    # Однаковий seed — однакова послідовність сторінок, тегів і постів у кожному прогоні
+    rnd = random.Random(seed)
+    pages = max(1, (posts + 1) // 2)
+    post_ids = [rnd.randint(1, posts) for _ in range(total)]
+    return {
+        '/': [('GET', f'{base_url}/', None)] * total,
+        '/posts?page=N': [('GET', f'{base_url}/posts?page={rnd.randint(1, pages)}', None) for _ in range(total)],
+        '/posts?tag=X': [('GET', f'{base_url}/posts?tag={rnd.choice(TAGS[:20])}&page={rnd.randint(1, 3)}', None)
+                         for _ in range(total)],
+        '/post/<id>': [('GET', f'{base_url}/post/{post_id}', None) for post_id in post_ids],
+        # Останнім: нові коментарі скидають кеш сторінок
+        'POST /post/<id>': [('POST', f'{base_url}/post/{post_id}',
+                             {'name': 'Bench', 'message': f'comment {i}'})
+                            for i, post_id in enumerate(post_ids)],
+    }
+
+
+def run_suite(scales, total, concurrency, workers, data_dir, reseed=False, port=8100):
+    os.makedirs(data_dir, exist_ok=True)
+    report = {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'commit': _git_commit(),
+        'settings': {'requests_per_route': total, 'concurrency': concurrency, 'workers': workers},
+        'scales': [],
+    }
+    for scale in scales:
+        db_path = os.path.join(data_dir, f'blog-{scale}.db')
+        result = {'posts': scale}
+        if reseed or not os.path.exists(db_path):
+            started = time.perf_counter()
+            counts = seed_database(db_path, scale)
+            result['seed_seconds'] = round(time.perf_counter() - started, 1)
+            print(f"seeded {db_path}: {counts['posts']} posts, {counts['comments']} comments", file=sys.stderr)
+        # Прогін не змінює збережену базу: сервер працює з копією
+        run_path = os.path.join(data_dir, f'run-{scale}.db')
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(run_path + suffix):
+                os.remove(run_path + suffix)
+        with sqlite3.connect(db_path) as source, sqlite3.connect(run_path) as target:
+            source.backup(target)
+        result['db_bytes'] = os.path.getsize(db_path)
+        process, base_url = start_server(run_path, port, workers, data_dir)
+        try:
+            result['routes'] = {}
+            for route, workload in route_workloads(base_url, scale, total).items():
+                measure(workload[:min(20, total)], concurrency)  # прогрів з'єднань і кешів
+                result['routes'][route] = stats = measure(workload, concurrency)
+                print(f"{scale:>7} posts  {route:<18} p50 {stats['latency_ms']['p50']:8.2f} ms  "
+                      f"p99 {stats['latency_ms']['p99']:8.2f} ms  {stats['throughput_rps']:8.1f} req/s",
+                      file=sys.stderr)
+            result['server_peak_rss_kb'] = peak_rss_kb(process.pid)
+        finally:
+            stop_server(process)
+        os.remove(run_path)
+        report['scales'].append(result)
+    return report
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /posts and /post/<id>")
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--post-id', default='1')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--middleware', action='store_true', help="measure request middleware overhead in-process")
+    parser.add_argument('--comments', action='store_true', help="measure comment tree build and render at 1k and 10k comments")
+    parser.add_argument('--suite', action='store_true',
+                        help="seed synthetic databases, run every public route against a local server, print JSON")
+    parser.add_argument('--scales', default=','.join(map(str, DEFAULT_SCALES)), help="post counts for --suite")
+    parser.add_argument('--workers', type=int, default=1, help="server workers for --suite")
+    parser.add_argument('--data-dir', default='bench_data', help="seeded databases for --suite are kept here")
+    parser.add_argument('--reseed', action='store_true', help="rebuild seeded databases for --suite")
+    parser.add_argument('--output', help="write the --suite JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    if args.suite:
+        scales = [int(scale) for scale in args.scales.split(',')]
+        report = run_suite(scales, args.requests, args.concurrency, args.workers, args.data_dir, args.reseed)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+        else:
+            print(json.dumps(report, indent=2))
+        return
+
+    if args.middleware:
+        bench_middleware(args.requests * 100)
+        return
+    if args.comments:
+        bench_comments([1000, 10000])
+        return
+
+    routes = ['/posts', f'/post/{args.post_id}']
+    for route in routes:
+        url = args.base_url.rstrip('/') + route
+        hit(url)  # прогрів
+        rps, errors = run(url, args.requests, args.concurrency)
+        print(f"{route:<20} {rps:10.1f} req/s  errors: {errors}")
+
+
+if __name__ == '__main__':
+    main()
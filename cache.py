@@ -0,0 +1,113 @@
+import os
+from multiprocessing import Array, Value
+from cachetools import TTLCache
+from config import PAGE_CACHE_MAX_BYTES, PAGE_CACHE_TTL, FEED_CACHE_TTL, CHANGE_LOG_SIZE
+
+# Події, які передаються між воркерами: зміни контенту (див. notify_change у models.py)
+# і перезавантаження перекладів за SIGHUP
+CHANGE_EVENTS = ('post_created', 'post_updated', 'post_deleted', 'comment_created', 'comment_deleted',
+                 'translations_reloaded')
+
+
+class PageCache:
+    # Кеш відрендереного HTML публічних сторінок.
+    # Ключ — кортеж (маршрут, мова, параметри...), значення — (тіло в байтах, etag, last_modified).
+    # TTLCache витісняє найдавніше використані записи, коли сума розмірів перевищує ліміт.
+    def __init__(self, max_bytes=PAGE_CACHE_MAX_BYTES, ttl=PAGE_CACHE_TTL):
+        self._cache = TTLCache(maxsize=max_bytes, ttl=ttl, getsizeof=lambda entry: len(entry[0]))
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self._cache.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def set(self, key, body, etag=None, last_modified=None):
+        if isinstance(body, str):
+            body = body.encode()
+        entry = (body, etag, last_modified)
+        if len(body) <= self._cache.maxsize:
+            self._cache[key] = entry
+        return entry
+
+    def invalidate(self, route, post_id=None):
+        # id поста в ключах сторінок — число (маршрути /post/<post_id:int>)
+        for key in list(self._cache.keys()):
+            if key[0] == route and (post_id is None or key[2] == int(post_id)):
+                self._cache.pop(key, None)
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self._cache),
+            'bytes': self._cache.currsize,
+            'max_bytes': self._cache.maxsize,
+        }
+
+
+class ChangeLog:
+    # Останні зміни контенту в спільній пам'яті воркерів: кільцевий буфер записів
+    # (подія, id поста, pid воркера) і лічильник усіх записаних змін. Кожен воркер
+    # повторює чужі зміни тією самою точковою інвалідацією, що й воркер, який їх зробив.
+    def __init__(self):
+        self._shared = None
+        self._seen = 0
+
+    @staticmethod
+    def allocate(size=CHANGE_LOG_SIZE):
+        # Викликається в головному процесі; кортеж кладеться в app.shared_ctx
+        count = Value('Q', 0)
+        lock = count.get_lock()
+        return (count, Array('B', size, lock=lock), Array('q', size, lock=lock), Array('i', size, lock=lock))
+
+    def attach(self, shared):
+        # Воркер стартує з порожніми кешами, тож попередні зміни йому не потрібні
+        self._shared = shared
+        self._seen = shared[0].value if shared else 0
+
+    def publish(self, event, post_id):
+        if self._shared is None:
+            return
+        count, events, post_ids, pids = self._shared
+        with count.get_lock():
+            slot = count.value % len(events)
+            events[slot] = CHANGE_EVENTS.index(event)
+            post_ids[slot] = post_id
+            pids[slot] = os.getpid()
+            count.value += 1
+
+    def pending(self):
+        # Зміни інших воркерів з попередньої перевірки, по порядку. None — якщо воркер
+        # відстав більше ніж на розмір буфера і частину записів уже перезаписано
+        if self._shared is None:
+            return ()
+        count, events, post_ids, pids = self._shared
+        if count.value == self._seen:
+            return ()
+        pid = os.getpid()
+        with count.get_lock():
+            total = count.value
+            if total - self._seen > len(events):
+                self._seen = total
+                return None
+            changes = []
+            for number in range(self._seen, total):
+                slot = number % len(events)
+                if pids[slot] != pid:
+                    changes.append((CHANGE_EVENTS[events[slot]], post_ids[slot]))
+            self._seen = total
+        return changes
+
+
+page_cache = PageCache()
+# Стрічки новин і карта сайту: залежать лише від постів, тож коментарі їх не скидають
+feed_cache = PageCache(ttl=FEED_CACHE_TTL)
+change_log = ChangeLog()
@@ -0,0 +1,121 @@
+import asyncio
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+
+# Перевірка планів запитів: виконує кожен метод моделей на тимчасовій базі,
+# збирає всі SQL-запити і для кожного дивиться EXPLAIN QUERY PLAN.
+# Повний прохід по таблиці без індексу вважається помилкою (exit code 1).
+# Запуск: python check_query_plans.py
+
+_tmpdir = tempfile.mkdtemp()
+os.environ['DB_PATH'] = os.path.join(_tmpdir, 'plans.db')
+os.environ.setdefault('USER_LOOKUP_KEY', 'query-plans')
+
+from db import db  # noqa: E402
+from models import (init_db, create_superuser, get_content_version, User, BlogPost, Comment, Outbox,  # noqa: E402
+                    UserSession, LoginAttempt)
+
+# Таблиці, для яких повний прохід очікуваний: службова таблиця налаштувань FTS5 з кількох рядків
+ALLOWED_SCANS = {'main.posts_fts_config'}
+
+
+async def exercise_models():
+    post_id = await BlogPost.create('Заголовок', 'Title', None, '<p>текст</p>', '<p>text</p>', 'news help')
+    other_id = await BlogPost.create('Другий', 'Second', None, '<p>текст</p>', '<p>text</p>', 'news')
+    await Comment.create(post_id, 'name', 'message')
+    await Comment.create(post_id, 'name', 'reply', 1)
+
+    await User.authenticate('admin', 'password')
+    await LoginAttempt.hit('127.0.0.1', 1000.0, 300, 10)
+    await LoginAttempt.reset('127.0.0.1')
+    await BlogPost.get_all()
+    await BlogPost.get_admin_page()
+    await BlogPost.get_admin_page(('9999', 10), 1)
+    await BlogPost.get_by_id(post_id)
+    await BlogPost.get_detail(post_id, 'uk')
+    await BlogPost.exists(post_id)
+    await BlogPost.get_by_tag('news')
+    await BlogPost.get_tag_counts()
+    await BlogPost.get_page(None, 1, 2)
+    await BlogPost.get_page('news', 1, 2)
+    await BlogPost.get_navigation_posts(post_id)
+    await BlogPost.get_latest_posts(2)
+    await BlogPost.search('текст', 'uk', 1, 10)
+    await BlogPost.count()
+    await BlogPost.get_feed('en', 20)
+    await BlogPost.get_sitemap_page(1, 50000)
+    await get_content_version(comments=False)
+    await BlogPost.update(other_id, 'Другий', 'Second', None, '<p>текст</p>', '<p>text</p>', 'army')
+    await Comment.get_by_post_id(post_id)
+    await Comment.get_comment_count_by_post_id(post_id)
+    await Comment.get_all()
+    await Comment.get_admin_page()
+    await Comment.get_admin_page(('9999', 10), 1)
+    await get_content_version()
+    await get_content_version(post_id)
+    message_id = await Outbox.enqueue('from@example.com', 'to@example.com', 'subject', 'body')
+    await Outbox.claim_due(10)
+    await Outbox.mark_retry(message_id, 'error', 30)
+    await Outbox.mark_sent(message_id)
+    await Outbox.mark_failed(message_id, 'error')
+    await UserSession.save('sid', '{"user": "admin"}', 2000000000)
+    await UserSession.get('sid', 1000000000)
+    await UserSession.delete_expired(1000000000)
+    await UserSession.delete('sid')
+    await Comment.delete(2)
+    await Comment.delete_many([1, 2])
+    await BlogPost.delete(other_id)
+
+
+def find_full_scans(conn, sql):
+    rows = conn.execute('EXPLAIN QUERY PLAN ' + sql).fetchall()
+    details = [row[3] for row in rows]
+    # Підзапити (CO-ROUTINE/MATERIALIZE) обходяться повністю, але вони вже обмежені
+    subqueries = {m.group(1) for d in details for m in [re.match(r'(?:CO-ROUTINE|MATERIALIZE) (\S+)', d)] if m}
+    scans = []
+    for detail in details:
+        m = re.match(r'SCAN (\S+)', detail)
+        if not m or 'INDEX' in detail or detail == 'SCAN CONSTANT ROW':
+            continue
+        if m.group(1) not in subqueries and m.group(1) not in ALLOWED_SCANS:
+            scans.append(detail)
+    return details, scans
+
+
+async def collect_statements():
+    statements = []
+    await db.open()
+    await init_db()
+    await create_superuser()
+    await db.set_trace_callback(statements.append)
+    await exercise_models()
+    await db.close()
+    return statements
+
+
+def main():
+    statements = asyncio.run(collect_statements())
+    conn = sqlite3.connect(os.environ['DB_PATH'])
+    failed = 0
+    seen = set()
+    for sql in statements:
+        sql = sql.strip()
+        if not re.match(r'(SELECT|UPDATE|DELETE)\b', sql, re.IGNORECASE) or sql in seen:
+            continue
+        seen.add(sql)
+        details, scans = find_full_scans(conn, sql)
+        if scans:
+            failed += 1
+            print('FULL SCAN:', ' '.join(sql.split()))
+            for detail in details:
+                print('    ', detail)
+    conn.close()
+    print(f"{len(seen)} queries checked, {failed} with full table scans")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,93 @@
 import os
+from dotenv import load_dotenv
 
-DB_PATH = os.path.join(os.path.dirname(__file__), 'blog.db')
+# .env читається тут, до першого os.getenv, а не після імпорту config в app.py
+load_dotenv()
+
+DB_PATH = os.getenv('DB_PATH', os.path.join(os.path.dirname(__file__), 'blog.db'))
 SECRET_KEY = 'your-secret-key'
-REQUEST_MAX_SIZE = int(os.getenv('REQUEST_MAX_SIZE', 50 * 1024 * 1024))
\ No newline at end of file
+REQUEST_MAX_SIZE = int(os.getenv('REQUEST_MAX_SIZE', 50 * 1024 * 1024))
+DB_READERS = int(os.getenv('DB_READERS', 4))
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', 256 * 1024 * 1024))
+# Від'ємне значення — розмір кешу в КіБ
+DB_CACHE_SIZE = int(os.getenv('DB_CACHE_SIZE', -16000))
+
+PAGE_CACHE_MAX_BYTES = int(os.getenv('PAGE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+PAGE_CACHE_TTL = int(os.getenv('PAGE_CACHE_TTL', 300))
+# Скільки останніх змін контенту пам'ятається для інших воркерів (див. cache.ChangeLog)
+CHANGE_LOG_SIZE = int(os.getenv('CHANGE_LOG_SIZE', 256))
+# Скільки секунд браузер може показувати публічну сторінку без повторної перевірки
+PAGE_MAX_AGE = int(os.getenv('PAGE_MAX_AGE', 60))
+
+# Доставка листів контактної форми: 'gmail' або 'fake' (нічого не відправляє, для розробки)
+MAIL_TRANSPORT = os.getenv('MAIL_TRANSPORT', 'gmail')
+MAIL_MAX_ATTEMPTS = int(os.getenv('MAIL_MAX_ATTEMPTS', 6))
+MAIL_RETRY_BASE = int(os.getenv('MAIL_RETRY_BASE', 30))
+MAIL_RETRY_MAX = int(os.getenv('MAIL_RETRY_MAX', 3600))
+MAIL_POLL_INTERVAL = int(os.getenv('MAIL_POLL_INTERVAL', 30))
+
+UPLOAD_DIR = os.getenv('UPLOAD_DIR', 'static/uploads')
+# Ширини зменшених копій зображень для srcset
+IMAGE_WIDTHS = tuple(int(width) for width in os.getenv('IMAGE_WIDTHS', '480,960,1600').split(','))
+UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', 2))
+
+STATIC_DIR = os.getenv('STATIC_DIR', 'static')
+# Результат "python assets.py": хешовані копії, .br/.gz і manifest.json
+STATIC_BUILD_DIR = os.getenv('STATIC_BUILD_DIR', 'static_build')
+# Файли з незмінними (хешованими) іменами кешуються на рік, решта — на STATIC_MAX_AGE
+STATIC_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+STATIC_MAX_AGE = int(os.getenv('STATIC_MAX_AGE', 3600))
+
+# Ключ HMAC для пошуку користувача за логіном; зміна ключа вимагає перевипуску username_key.
+# Обов'язковий і без значення за замовчуванням: з публічним ключем логіни з копії бази
+# підбираються перебором. Без нього сервер не стартує (див. prepare_db в app.py)
+USER_LOOKUP_KEY = os.getenv('USER_LOOKUP_KEY', '')
+AUTH_WORKERS = int(os.getenv('AUTH_WORKERS', 2))
+# Не більше LOGIN_RATE_LIMIT спроб входу з однієї IP-адреси за LOGIN_RATE_WINDOW секунд
+LOGIN_RATE_LIMIT = int(os.getenv('LOGIN_RATE_LIMIT', 10))
+LOGIN_RATE_WINDOW = int(os.getenv('LOGIN_RATE_WINDOW', 300))
+
+# Сховище сесій: 'sqlite' (спільне для воркерів) або 'memory' (лише один процес)
+SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'sqlite')
+SESSION_EXPIRY = int(os.getenv('SESSION_EXPIRY', 30 * 24 * 3600))
+# Скільки секунд воркер може брати сесію з власного кешу, не читаючи базу
+SESSION_CACHE_TTL = int(os.getenv('SESSION_CACHE_TTL', 10))
+SESSION_SWEEP_INTERVAL = int(os.getenv('SESSION_SWEEP_INTERVAL', 3600))
+
+# Параметри запуску сервера (python app.py)
+HOST = os.getenv('HOST', '0.0.0.0')
+PORT = int(os.getenv('PORT', 8000))
+WORKERS = int(os.getenv('WORKERS', os.cpu_count() or 1))
+BACKLOG = int(os.getenv('BACKLOG', 1024))
+KEEP_ALIVE_TIMEOUT = int(os.getenv('KEEP_ALIVE_TIMEOUT', 15))
+ACCESS_LOG = os.getenv('ACCESS_LOG', 'false').lower() in ('1', 'true', 'yes')
+# Sanic Inspector (sanic inspect reload --zero-downtime), слухає лише localhost
+INSPECTOR = os.getenv('INSPECTOR', 'false').lower() in ('1', 'true', 'yes')
+# Заголовок з адресою клієнта від проксі (nginx у config/nginx передає X-Real-IP).
+# Без нього за проксі всі клієнти мають IP nginx, і обмеження входу стає спільним для всіх.
+# Якщо сервер доступний напряму, без проксі, задайте REAL_IP_HEADER= (порожнім): заголовок підробляється
+REAL_IP_HEADER = os.getenv('REAL_IP_HEADER', 'x-real-ip').lower()
+
+# Скомпільований байткод шаблонів Jinja; перевірка змін шаблонів на кожному запиті — лише для розробки
+TEMPLATE_CACHE_DIR = os.getenv('TEMPLATE_CACHE_DIR', '.jinja_cache')
+TEMPLATE_AUTO_RELOAD = os.getenv('TEMPLATE_AUTO_RELOAD', 'false').lower() in ('1', 'true', 'yes')
+# Скільки байтів HTML накопичується перед відправкою чергової частини сторінки
+TEMPLATE_STREAM_BUFFER = int(os.getenv('TEMPLATE_STREAM_BUFFER', 4096))
+
+# Кількість рядків на сторінці списків в адмінці (пости, коментарі)
+ADMIN_PAGE_SIZE = int(os.getenv('ADMIN_PAGE_SIZE', 50))
+
+# Метрики (/metrics): знімки воркерів, токен для Prometheus (Authorization: Bearer ...)
+# і пороги, після яких запит записується в лог як повільний або з надто багатьма запитами до бази
+METRICS_DIR = os.getenv('METRICS_DIR', '.metrics')
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_FLUSH_INTERVAL = int(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+SLOW_REQUEST_SECONDS = float(os.getenv('SLOW_REQUEST_SECONDS', 1.0))
+REQUEST_QUERIES_WARN = int(os.getenv('REQUEST_QUERIES_WARN', 20))
+
+# Стрічка новин (/feed.xml) і карта сайту (/sitemap.xml). SITE_URL — адреса сайту для
+# абсолютних посилань (https://example.com); без неї береться з заголовка Host запиту
+SITE_URL = os.getenv('SITE_URL', '').rstrip('/')
+FEED_SIZE = int(os.getenv('FEED_SIZE', 20))
+# Документи перебудовуються після зміни постів; TTL лише страхує від забутих даних
+FEED_CACHE_TTL = int(os.getenv('FEED_CACHE_TTL', 24 * 3600))
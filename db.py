@@ -0,0 +1,247 @@
+import asyncio
+import sys
+import time
+import types
+from contextlib import asynccontextmanager
+import aiosqlite
+from config import DB_PATH, DB_READERS, DB_MMAP_SIZE, DB_CACHE_SIZE
+
+
+class TracedCursor:
+    # Курсор, що накопичує час і кількість рядків запиту; результат передається
+    # в observer один раз — при закритті курсора (кінець async with)
+    __slots__ = ('_cursor', '_observer', '_name', '_elapsed', '_rows', '_done')
+
+    def __init__(self, cursor, observer, name, elapsed):
+        self._cursor = cursor
+        self._observer = observer
+        self._name = name
+        self._elapsed = elapsed
+        self._rows = 0
+        self._done = False
+        if cursor.description is None:
+            # INSERT/UPDATE/DELETE без RETURNING: рядків для читання немає
+            self._rows = max(cursor.rowcount, 0)
+            self._finish()
+
+    def _finish(self):
+        if not self._done:
+            self._done = True
+            self._observer(self._name, self._elapsed, self._rows)
+
+    async def _fetch(self, fetch, *args):
+        start = time.perf_counter()
+        try:
+            return await fetch(*args)
+        finally:
+            self._elapsed += time.perf_counter() - start
+
+    async def fetchone(self):
+        row = await self._fetch(self._cursor.fetchone)
+        if row is not None:
+            self._rows += 1
+        return row
+
+    async def fetchmany(self, size=None):
+        rows = await self._fetch(self._cursor.fetchmany, size or self._cursor.arraysize)
+        self._rows += len(rows)
+        return rows
+
+    async def fetchall(self):
+        rows = await self._fetch(self._cursor.fetchall)
+        self._rows += len(rows)
+        return rows
+
+    async def close(self):
+        self._finish()
+        await self._cursor.close()
+
+    @property
+    def row_factory(self):
+        return self._cursor.row_factory
+
+    @row_factory.setter
+    def row_factory(self, factory):
+        self._cursor.row_factory = factory
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class _TracedQuery:
+    # Те саме, що повертає aiosqlite execute(): можна await або async with
+    __slots__ = ('_query', '_observer', '_name', '_cursor')
+
+    def __init__(self, query, observer, name):
+        self._query = query
+        self._observer = observer
+        self._name = name
+        self._cursor = None
+
+    async def _run(self):
+        start = time.perf_counter()
+        cursor = await self._query
+        return TracedCursor(cursor, self._observer, self._name, time.perf_counter() - start)
+
+    def __await__(self):
+        return self._run().__await__()
+
+    async def __aenter__(self):
+        self._cursor = await self._run()
+        return self._cursor
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._cursor.close()
+
+
+_query_labels = {}
+
+
+def register_query_labels(module):
+    # Для Python < 3.11, де немає code.co_qualname: один раз при імпорті модуля моделей
+    # зіставляє код кожної його функції й методу з __qualname__ (BlogPost.get_page)
+    for value in vars(module).values():
+        if isinstance(value, type) and value.__module__ == module.__name__:
+            functions = [getattr(item, '__func__', item) for item in vars(value).values()]
+        else:
+            functions = [value]
+        for function in functions:
+            if isinstance(function, types.FunctionType) and function.__module__ == module.__name__:
+                _query_labels[function.__code__] = function.__qualname__
+
+
+def _query_label(code):
+    # Назва функції, що виконала запит; для незареєстрованого коду — просто її ім'я
+    return getattr(code, 'co_qualname', None) or _query_labels.get(code) or code.co_name
+
+
+class TracedConnection:
+    # Обгортка з'єднання: кожен execute/executemany вимірюється і передається
+    # в observer(назва, секунди, рядки). Назва — функція, що виконала запит
+    # (наприклад, BlogPost.get_page)
+    __slots__ = ('_conn', '_observer')
+
+    def __init__(self, conn, observer):
+        self._conn = conn
+        self._observer = observer
+
+    def execute(self, sql, parameters=None):
+        name = _query_label(sys._getframe(1).f_code)
+        return _TracedQuery(self._conn.execute(sql, parameters), self._observer, name)
+
+    def executemany(self, sql, parameters):
+        name = _query_label(sys._getframe(1).f_code)
+        return _TracedQuery(self._conn.executemany(sql, parameters), self._observer, name)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class Database:
+    # Пул довготривалих з'єднань: одне з'єднання на запис і кілька на читання.
+    # Кожне з'єднання aiosqlite має власний потік, тому вони створюються один раз
+    # при старті сервера, а не на кожен запит.
+    def __init__(self, path, readers=DB_READERS):
+        self.path = path
+        self.readers_count = max(1, readers)
+        self._writer = None
+        self._write_lock = None
+        self._readers = None
+        self._all_readers = []
+        self._open_lock = None
+        # observer(назва, секунди, рядки) для кожного запиту, див. TracedConnection
+        self.query_observer = None
+
+    @property
+    def is_open(self):
+        return self._writer is not None
+
+    async def _connect(self):
+        conn = await aiosqlite.connect(self.path)
+        # executescript доводить кожну PRAGMA до кінця, тож курсор не тримає блокування
+        await conn.executescript(f'''
+            PRAGMA busy_timeout = 5000;
+            PRAGMA synchronous = NORMAL;
+            PRAGMA mmap_size = {int(DB_MMAP_SIZE)};
+            PRAGMA cache_size = {int(DB_CACHE_SIZE)};
+            PRAGMA temp_store = MEMORY;
+        ''')
+        return conn
+
+    def _get_open_lock(self):
+        # Lock створюється ліниво, щоб прив'язатися до циклу подій сервера
+        if self._open_lock is None:
+            self._open_lock = asyncio.Lock()
+        return self._open_lock
+
+    async def open(self):
+        async with self._get_open_lock():
+            if self.is_open:
+                return
+            writer = await self._connect()
+            connections = []
+            try:
+                # WAL дозволяє читачам не блокувати запис і навпаки
+                await writer.executescript('PRAGMA journal_mode = WAL;')
+                for _ in range(self.readers_count):
+                    connections.append(await self._connect())
+            except Exception:
+                for conn in [writer] + connections:
+                    await conn.close()
+                raise
+            readers = asyncio.Queue()
+            for conn in connections:
+                readers.put_nowait(conn)
+            self._all_readers = connections
+            self._readers = readers
+            self._write_lock = asyncio.Lock()
+            self._writer = writer
+
+    async def close(self):
+        async with self._get_open_lock():
+            if not self.is_open:
+                return
+            for conn in self._all_readers:
+                await conn.close()
+            await self._writer.close()
+            self._all_readers = []
+            self._readers = None
+            self._writer = None
+        self._open_lock = None
+
+    async def set_trace_callback(self, callback):
+        # Викликає callback з текстом кожного SQL-запиту на всіх з'єднаннях пулу
+        if not self.is_open:
+            await self.open()
+        for conn in [self._writer] + self._all_readers:
+            await conn.set_trace_callback(callback)
+
+    def _traced(self, conn):
+        return conn if self.query_observer is None else TracedConnection(conn, self.query_observer)
+
+    @asynccontextmanager
+    async def read(self):
+        if not self.is_open:
+            await self.open()
+        conn = await self._readers.get()
+        try:
+            yield self._traced(conn)
+        finally:
+            self._readers.put_nowait(conn)
+
+    @asynccontextmanager
+    async def write(self):
+        # Запис серіалізується через одне з'єднання; commit/rollback виконується тут
+        if not self.is_open:
+            await self.open()
+        async with self._write_lock:
+            try:
+                yield self._traced(self._writer)
+            except BaseException:
+                await self._writer.rollback()
+                raise
+            else:
+                await self._writer.commit()
+
+
+db = Database(DB_PATH)
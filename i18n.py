@@ -0,0 +1,46 @@
+import json
+import os
+from types import MappingProxyType
+
+LANGUAGES = ('uk', 'en')
+DEFAULT_LANGUAGE = 'uk'
+
+
+def freeze(value):
+    # Рекурсивно робить словники незмінними, щоб їх можна було спільно віддавати всім запитам
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+class TranslationCatalog:
+    # Усі переклади завантажуються один раз; reload() атомарно підміняє весь каталог
+    def __init__(self, directory='translations', languages=LANGUAGES):
+        self.directory = directory
+        self.languages = languages
+        self._catalog = {}
+
+    def load(self):
+        catalog = {}
+        for lang in self.languages:
+            with open(os.path.join(self.directory, f'{lang}.json'), 'r', encoding='utf-8') as f:
+                catalog[lang] = freeze(json.load(f))
+        self._catalog = catalog
+
+    def reload(self):
+        # Під час перезавантаження зі зламаним файлом залишаємо попередній каталог
+        try:
+            self.load()
+        except (OSError, ValueError) as e:
+            return e
+        return None
+
+    def get(self, lang):
+        if not self._catalog:
+            self.load()
+        return self._catalog.get(lang) or self._catalog[DEFAULT_LANGUAGE]
+
+
+catalog = TranslationCatalog()
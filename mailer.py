@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import os
+from base64 import urlsafe_b64encode
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import InstalledAppFlow
+from google.auth.transport.requests import Request
+from googleapiclient.discovery import build
+from config import MAIL_TRANSPORT, MAIL_MAX_ATTEMPTS, MAIL_RETRY_BASE, MAIL_RETRY_MAX, MAIL_POLL_INTERVAL
+from models import Outbox
+
+logger = logging.getLogger('sanic_app')
+
+SCOPES = ['https://www.googleapis.com/auth/gmail.send']
+
+
+def get_credentials():
+    creds = None
+    if os.path.exists('token.json'):
+        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
+    if not creds or not creds.valid:
+        if creds and creds.expired and creds.refresh_token:
+            creds.refresh(Request())
+        else:
+            flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
+            creds = flow.run_local_server(port=8080)
+        with open('token.json', 'w') as token:
+            token.write(creds.to_json())
+    return creds
+
+
+def create_message(sender, to, subject, message_text):
+    message = EmailMessage()
+    message.set_content(message_text)
+    message["To"] = to
+    message["From"] = sender
+    message["Subject"] = subject
+    raw_message = urlsafe_b64encode(message.as_bytes()).decode()
+    return {'raw': raw_message}
+
+
+class GmailTransport:
+    # Облікові дані та сервіс Gmail створюються один раз і перевикористовуються.
+    # send() синхронний, тому викликається лише з потоку воркера.
+    def __init__(self):
+        self._service = None
+
+    def send(self, message):
+        if self._service is None:
+            self._service = build('gmail', 'v1', credentials=get_credentials())
+        return self._service.users().messages().send(userId='me', body=message).execute()
+
+
+class FakeTransport:
+    # Локальний транспорт для розробки й перевірок: нічого не відправляє,
+    # запам'ятовує повідомлення і може імітувати задану кількість збоїв
+    def __init__(self, failures=0):
+        self.sent = []
+        self.failures = failures
+
+    def send(self, message):
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError("Fake transport failure")
+        self.sent.append(message)
+        logger.info(f"Fake transport accepted message #{len(self.sent)}")
+        return {'id': f'fake-{len(self.sent)}'}
+
+
+def make_transport(name=MAIL_TRANSPORT):
+    if name == 'fake':
+        return FakeTransport()
+    return GmailTransport()
+
+
+def retry_delay(attempts):
+    return min(MAIL_RETRY_BASE * 2 ** (attempts - 1), MAIL_RETRY_MAX)
+
+
+class MailWorker:
+    # Фоновий воркер, що доставляє листи з таблиці outbox.
+    # Відправка виконується в окремому потоці, щоб не блокувати цикл подій.
+    def __init__(self, transport=None, poll_interval=MAIL_POLL_INTERVAL):
+        self.transport = transport or make_transport()
+        self.poll_interval = poll_interval
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='mail')
+        self._wakeup = None
+        self._task = None
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._executor.shutdown(wait=False)
+
+    def wake(self):
+        if self._wakeup:
+            self._wakeup.set()
+
+    async def run(self):
+        while True:
+            try:
+                while await self.deliver_due():
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Mail worker error: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def deliver_due(self, limit=10):
+        # Повертає кількість оброблених листів
+        messages = await Outbox.claim_due(limit)
+        loop = asyncio.get_running_loop()
+        for message_id, sender, recipient, subject, body, attempts in messages:
+            message = create_message(sender, recipient, subject, body)
+            try:
+                result = await loop.run_in_executor(self._executor, self.transport.send, message)
+            except Exception as e:
+                if attempts >= MAIL_MAX_ATTEMPTS:
+                    logger.error(f"Message {message_id} failed after {attempts} attempts: {e}")
+                    await Outbox.mark_failed(message_id, str(e))
+                else:
+                    delay = retry_delay(attempts)
+                    logger.warning(f"Message {message_id} attempt {attempts} failed, retry in {delay}s: {e}")
+                    await Outbox.mark_retry(message_id, str(e), delay)
+                continue
+            await Outbox.mark_sent(message_id)
+            logger.info(f"Message Id: {result.get('id')}")
+        return len(messages)
+
+
+mail_worker = MailWorker()
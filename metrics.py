@@ -0,0 +1,229 @@
+import asyncio
+import contextvars
+import glob
+import json
+import logging
+import os
+import shutil
+import time
+from bisect import bisect_left
+from config import METRICS_DIR, METRICS_FLUSH_INTERVAL, SLOW_REQUEST_SECONDS, REQUEST_QUERIES_WARN
+
+logger = logging.getLogger('sanic_app')
+
+# Межі кошиків гістограм, секунди
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+# Кількість запитів до бази на один HTTP-запит
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, label_values, amount=1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    @staticmethod
+    def merge(a, b):
+        return a + b
+
+    def samples(self, labels, value):
+        yield self.name, labels, value
+
+
+class Histogram:
+    # Значення: лічильники кошиків (не накопичувальні), сума і кількість спостережень
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}
+
+    def observe(self, label_values, value):
+        data = self.values.get(label_values)
+        if data is None:
+            data = self.values[label_values] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        data[bisect_left(self.buckets, value)] += 1
+        data[-2] += value
+        data[-1] += 1
+
+    @staticmethod
+    def merge(a, b):
+        return [x + y for x, y in zip(a, b)]
+
+    def samples(self, labels, data):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), data):
+            cumulative += count
+            yield f'{self.name}_bucket', labels + (('le', bound),), cumulative
+        yield f'{self.name}_sum', labels, data[-2]
+        yield f'{self.name}_count', labels, data[-1]
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+class RequestStats:
+    # Запити до бази в межах одного HTTP-запиту
+    __slots__ = ('started', 'queries', 'query_time')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_time = 0.0
+
+
+_request_stats = contextvars.ContextVar('request_stats', default=None)
+
+
+class Metrics:
+    # Метрики воркера в пам'яті. Кожен воркер періодично зберігає знімок у
+    # METRICS_DIR/<pid>.json, а /metrics складає знімки всіх воркерів, тож відповідь
+    # не залежить від того, який воркер її віддав (дані інших — із затримкою до
+    # METRICS_FLUSH_INTERVAL). Знімки зупинених воркерів лишаються, щоб лічильники не спадали.
+    def __init__(self, directory=METRICS_DIR):
+        self.directory = directory
+        self.http_requests = Counter(
+            'http_requests_total', 'HTTP requests by route, method and status',
+            ('route', 'method', 'status'))
+        self.http_duration = Histogram(
+            'http_request_duration_seconds', 'Time from routing to the full response',
+            ('route', 'method'), HTTP_BUCKETS)
+        self.request_queries = Histogram(
+            'http_request_db_queries', 'Database queries issued while handling one request',
+            ('route',), QUERY_COUNT_BUCKETS)
+        self.query_duration = Histogram(
+            'db_query_duration_seconds', 'Query execution and fetch time by calling function',
+            ('query',), QUERY_BUCKETS)
+        self.query_rows = Counter(
+            'db_query_rows_total', 'Rows returned or changed by calling function',
+            ('query',))
+        self._all = (self.http_requests, self.http_duration, self.request_queries,
+                     self.query_duration, self.query_rows)
+        self._flusher = None
+
+    def start_request(self):
+        stats = RequestStats()
+        _request_stats.set(stats)
+        return stats
+
+    def finish_request(self, route, method, status):
+        stats = _request_stats.get()
+        if stats is None:
+            return
+        _request_stats.set(None)
+        elapsed = time.perf_counter() - stats.started
+        self.http_requests.inc((route, method, str(status)))
+        self.http_duration.observe((route, method), elapsed)
+        self.request_queries.observe((route,), stats.queries)
+        if elapsed >= SLOW_REQUEST_SECONDS:
+            logger.warning(f"Slow request {method} {route}: {elapsed:.3f}s, "
+                           f"{stats.queries} queries in {stats.query_time:.3f}s")
+        elif stats.queries >= REQUEST_QUERIES_WARN:
+            logger.warning(f"{method} {route} issued {stats.queries} queries")
+
+    def observe_query(self, name, elapsed, rows):
+        # Викликається для кожного запиту моделей (Database.query_observer)
+        self.query_duration.observe((name,), elapsed)
+        self.query_rows.inc((name,), rows)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.query_time += elapsed
+
+    def snapshot(self):
+        return {
+            metric.name: [[list(labels), value] for labels, value in metric.values.items()]
+            for metric in self._all
+        }
+
+    def _snapshot_path(self, pid=None):
+        return os.path.join(self.directory, f'{pid or os.getpid()}.json')
+
+    def write_snapshot(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._snapshot_path()
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(f'{path}.tmp', path)
+
+    def reset_snapshots(self):
+        # При старті сервера: лічильники починаються з нуля
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def collect(self):
+        # Знімки інших воркерів плюс поточні значення цього
+        snapshots = []
+        own = self._snapshot_path()
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            if path == own:
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        snapshots.append(self.snapshot())
+        merged = {}
+        for metric in self._all:
+            values = merged[metric.name] = {}
+            for snapshot in snapshots:
+                for labels, value in snapshot.get(metric.name, ()):
+                    labels = tuple(labels)
+                    values[labels] = metric.merge(values[labels], value) if labels in values else value
+        return merged
+
+    def render(self):
+        # Текстовий формат Prometheus
+        merged = self.collect()
+        lines = []
+        for metric in self._all:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for label_values, value in sorted(merged[metric.name].items()):
+                labels = tuple(zip(metric.labels, label_values))
+                for name, sample_labels, sample in metric.samples(labels, value):
+                    lines.append(f'{name}{_format_labels(sample_labels)} {sample}')
+        return '\n'.join(lines) + '\n'
+
+    async def _flush_forever(self, interval):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await loop.run_in_executor(None, self.write_snapshot)
+            except Exception as e:
+                logger.error(f"Metrics snapshot failed: {e}")
+
+    def start_flusher(self, interval=METRICS_FLUSH_INTERVAL):
+        self._flusher = asyncio.get_running_loop().create_task(self._flush_forever(interval))
+
+    async def stop_flusher(self):
+        if self._flusher:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        self.write_snapshot()
+
+
+metrics = Metrics()
@@ -1,63 +1,428 @@
-import aiosqlite
+import asyncio
+import hashlib
+import hmac
+import html
+import json
+import sys
+from collections import namedtuple
+from html.parser import HTMLParser
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
-from config import DB_PATH
-from datetime import datetime
+from db import db, register_query_labels
+from datetime import datetime, timedelta
+from config import USER_LOOKUP_KEY, SECRET_KEY, AUTH_WORKERS
 
 # Ініціалізація контексту хешування
 pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+# Перевірка pbkdf2 займає десятки мілісекунд CPU, тому виконується поза циклом подій
+_auth_executor = ThreadPoolExecutor(max_workers=AUTH_WORKERS, thread_name_prefix='auth')
+
+
+async def _create_base_tables(conn):
+    await conn.execute('''CREATE TABLE IF NOT EXISTS users (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        username TEXT UNIQUE NOT NULL,
+                        password TEXT NOT NULL)''')
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS blogposts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title_uk TEXT NOT NULL,
+            title_en TEXT NOT NULL,
+            main_image TEXT,
+            publication_date TEXT DEFAULT CURRENT_TIMESTAMP,
+            text_uk TEXT NOT NULL,
+            text_en TEXT NOT NULL,
+            tags TEXT
+        )
+    ''')
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS comments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            post_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            message TEXT NOT NULL,
+            parent_id INTEGER,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (post_id) REFERENCES blogposts (id),
+            FOREIGN KEY (parent_id) REFERENCES comments (id)
+        )
+    ''')
+
+
+async def _create_post_tags(conn):
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS post_tags (
+            post_id INTEGER NOT NULL,
+            tag TEXT NOT NULL,
+            PRIMARY KEY (post_id, tag),
+            FOREIGN KEY (post_id) REFERENCES blogposts (id)
+        )
+    ''')
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_post_tags_tag ON post_tags (tag, post_id)')
+    # Заповнення post_tags з наявних рядків тегів
+    async with conn.execute('SELECT id, tags FROM blogposts') as cursor:
+        rows = await cursor.fetchall()
+    await conn.executemany(
+        'INSERT OR IGNORE INTO post_tags (post_id, tag) VALUES (?, ?)',
+        [(post_id, tag) for post_id, tags in rows for tag in split_tags(tags)]
+    )
+
+
+async def _create_indexes(conn):
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_blogposts_publication_date ON blogposts (publication_date)')
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_comments_post_id_created_at ON comments (post_id, created_at)')
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_comments_created_at ON comments (created_at)')
+
+
+async def _add_updated_at(conn):
+    # Час останньої зміни поста — основа для ETag/Last-Modified
+    await conn.execute('ALTER TABLE blogposts ADD COLUMN updated_at TEXT')
+    await conn.execute('UPDATE blogposts SET updated_at = publication_date')
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_blogposts_updated_at ON blogposts (updated_at)')
+
+
+async def _create_outbox(conn):
+    # Черга вихідних листів контактної форми
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sender TEXT,
+            recipient TEXT,
+            subject TEXT,
+            body TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TEXT NOT NULL,
+            last_error TEXT,
+            created_at TEXT NOT NULL,
+            sent_at TEXT
+        )
+    ''')
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_outbox_status_next_attempt ON outbox (status, next_attempt_at)')
+
+
+async def _add_main_image_variants(conn):
+    # JSON з адаптивними копіями головного зображення (див. uploads.py)
+    await conn.execute('ALTER TABLE blogposts ADD COLUMN main_image_variants TEXT')
+
+
+async def _add_username_key(conn):
+    # Логіни зберігаються як pbkdf2-хеші з сіллю, тож знайти користувача за ними
+    # можна лише перебором. username_key — HMAC логіна, за яким працює індекс.
+    # Наявні рядки отримують ключ під час першого успішного входу.
+    await conn.execute('ALTER TABLE users ADD COLUMN username_key TEXT')
+    await conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username_key ON users (username_key)')
+
+
+async def _create_sessions(conn):
+    # Сесії адміністраторів спільні для всіх воркерів; expires_at — unix-час
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS sessions (
+            sid TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            expires_at INTEGER NOT NULL
+        )
+    ''')
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions (expires_at)')
+
+
+async def _create_search_index(conn):
+    # Повнотекстовий індекс: rowid = id поста, тексти без HTML-розмітки
+    await conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(
+            title_uk, title_en, body_uk, body_en,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    ''')
+    async with conn.execute('SELECT id, title_uk, title_en, text_uk, text_en FROM blogposts') as cursor:
+        rows = await cursor.fetchall()
+    for post_id, title_uk, title_en, text_uk, text_en in rows:
+        await save_search_index(conn, post_id, title_uk, title_en, text_uk, text_en)
+
+
+async def _create_login_attempts(conn):
+    # Спроби входу для обмеження частоти; спільні для всіх воркерів, як і сесії
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS login_attempts (
+            client TEXT NOT NULL,
+            attempted_at REAL NOT NULL
+        )
+    ''')
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_login_attempts_client ON login_attempts (client, attempted_at)')
+    await conn.execute('CREATE INDEX IF NOT EXISTS idx_login_attempts_attempted_at ON login_attempts (attempted_at)')
+
+
+async def _create_content_changes(conn):
+    # Час останнього видалення постів і коментарів (scope 'posts' / 'comments'):
+    # видалений рядок не бачить жоден MAX(...), а Last-Modified має зрушити
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS content_changes (
+            scope TEXT PRIMARY KEY,
+            changed_at TEXT NOT NULL
+        )
+    ''')
+
+
+# Міграції схеми. Номер міграції — її позиція у списку, застосована версія
+# зберігається в PRAGMA user_version. Нові зміни схеми додаються лише в кінець.
+MIGRATIONS = [
+    _create_base_tables,
+    _create_post_tags,
+    _create_indexes,
+    _add_updated_at,
+    _create_outbox,
+    _add_main_image_variants,
+    _add_username_key,
+    _create_sessions,
+    _create_search_index,
+    _create_login_attempts,
+    _create_content_changes,
+]
 
 
 async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute('''CREATE TABLE IF NOT EXISTS users (
-                            id INTEGER PRIMARY KEY AUTOINCREMENT,
-                            username TEXT UNIQUE NOT NULL,
-                            password TEXT NOT NULL)''')
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS blogposts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title_uk TEXT NOT NULL,
-                title_en TEXT NOT NULL,
-                main_image TEXT,
-                publication_date TEXT DEFAULT CURRENT_TIMESTAMP,
-                text_uk TEXT NOT NULL,
-                text_en TEXT NOT NULL,
-                tags TEXT
-            )
-        ''')
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS comments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                post_id INTEGER NOT NULL,
-                name TEXT NOT NULL,
-                message TEXT NOT NULL,
-                parent_id INTEGER,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (post_id) REFERENCES blogposts (id),
-                FOREIGN KEY (parent_id) REFERENCES comments (id)
-            )
-        ''')
-        await db.commit()
+    async with db.write() as conn:
+        while True:
+            # Кожна міграція виконується в окремій транзакції; версія читається
+            # всередині неї, тож паралельний старт кількох воркерів безпечний
+            await conn.execute('BEGIN IMMEDIATE')
+            async with conn.execute('PRAGMA user_version') as cursor:
+                version = (await cursor.fetchone())[0]
+            if version >= len(MIGRATIONS):
+                await conn.commit()
+                break
+            await MIGRATIONS[version](conn)
+            await conn.execute(f'PRAGMA user_version = {version + 1}')
+            await conn.commit()
+
+
+def split_tags(tags):
+    # Теги розділяються пробілами, так само як у шаблонах
+    if not tags:
+        return []
+    return list(dict.fromkeys(tag.strip() for tag in tags.split() if tag.strip()))
+
+
+async def save_post_tags(conn, post_id, tags):
+    await conn.execute('DELETE FROM post_tags WHERE post_id = ?', (post_id,))
+    await conn.executemany(
+        'INSERT INTO post_tags (post_id, tag) VALUES (?, ?)',
+        [(post_id, tag) for tag in split_tags(tags)]
+    )
+
+
+class _TextExtractor(HTMLParser):
+    # Текст HTML-документа без тегів, скриптів і стилів; сутності вже розкодовані
+    SKIP_TAGS = {'script', 'style'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS and self._skip:
+            self._skip -= 1
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+
+def html_to_text(value):
+    if not value:
+        return ''
+    extractor = _TextExtractor()
+    extractor.feed(value)
+    extractor.close()
+    return ' '.join(' '.join(extractor.parts).split())
+
+
+async def save_search_index(conn, post_id, title_uk, title_en, text_uk, text_en):
+    await conn.execute('DELETE FROM posts_fts WHERE rowid = ?', (post_id,))
+    await conn.execute(
+        'INSERT INTO posts_fts (rowid, title_uk, title_en, body_uk, body_en) VALUES (?, ?, ?, ?, ?)',
+        (post_id, title_uk, title_en, html_to_text(text_uk), html_to_text(text_en))
+    )
+
+
+def search_query(text):
+    # Запит користувача -> безпечний вираз FTS5: кожне слово в лапках і з пошуком за префіксом
+    words = [word.replace('"', '') for word in text.split()]
+    return ' '.join(f'"{word}"*' for word in words if word)
+
+
+# Позначки підсвічування у сніпетах; замінюються на <mark> після екранування HTML
+MARK_START, MARK_END = '\x02', '\x03'
+
+
+def highlight_html(value):
+    return html.escape(value or '').replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+
+def _row_type(name, fields):
+    # namedtuple без __dict__ (місця як у звичайного кортежу) з доступом за іменами полів.
+    # from_row — фабрика рядків для cursor.row_factory
+    row_type = namedtuple(name, fields)
+    row_type.from_row = staticmethod(lambda cursor, row: row_type._make(row))
+    return row_type
+
+
+# Проєкції постів: повний рядок потрібен лише редактору, решта сторінок
+# отримують тільки ті колонки, які показують
+PostRow = _row_type('PostRow', 'id title_uk title_en main_image publication_date text_uk text_en tags '
+                               'updated_at main_image_variants')
+# Сторінка поста: заголовок і текст лише мови сторінки
+PostDetail = _row_type('PostDetail', 'id title main_image publication_date text tags main_image_variants')
+PostSummary = _row_type('PostSummary', 'id title_uk title_en main_image publication_date tags main_image_variants')
+PostListItem = _row_type('PostListItem', PostSummary._fields + ('comment_count',))
+PostLink = _row_type('PostLink', 'id title_uk title_en')
+PostAdminItem = _row_type('PostAdminItem', 'id title_uk title_en main_image publication_date tags')
+TagCount = _row_type('TagCount', 'tag posts')
+SearchResult = _row_type('SearchResult', 'id title snippet publication_date main_image')
+CommentRow = _row_type('CommentRow', 'id post_id name message parent_id created_at')
+CommentAdminItem = _row_type('CommentAdminItem', 'id post_id name message created_at')
+ContentVersion = _row_type('ContentVersion', 'posts_updated_at posts comments_created_at comments')
+OutboxMessage = _row_type('OutboxMessage', 'id sender recipient subject body attempts')
+# Стрічка новин (Atom) і карта сайту
+FeedEntry = _row_type('FeedEntry', 'id title text publication_date updated_at tags')
+SitemapEntry = _row_type('SitemapEntry', 'id updated_at')
+
+
+def _columns(row_type, alias=''):
+    return ', '.join(alias + field for field in row_type._fields)
+
+
+# Список id передається одним JSON-параметром, тож розмір не впирається в ліміт змінних SQLite
+_JSON_IDS = '(SELECT value FROM json_each(?))'
+
+
+def _keyset_page(rows, limit, key):
+    # Зайвий (limit + 1)-й рядок показує, що є наступна сторінка
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, key(rows[-1])
+    return rows, None
+
+
+# Слухачі змін контенту (інвалідація кешів). Викликаються після коміту
+# з назвою події та id поста, якого вона стосується.
+_change_listeners = []
+
+
+def on_change(listener):
+    _change_listeners.append(listener)
+    return listener
+
+
+def notify_change(event, post_id):
+    for listener in _change_listeners:
+        listener(event, post_id)
 
 
 async def create_superuser():
     username = '$pbkdf2-sha256$29000$xLj3Xgth7P1fa80ZI4Rwzg$fJDuGZOV/o.1BbzotIkfJUTQr.ioz/YUmr.XUjFn2SM'
     password = '$pbkdf2-sha256$29000$6V1Laa0Vwvjf.5/z/v./Nw$MEB2iDetbwoFuhrZn4OgZXI73WH9yJW14ivGdfgfKkM'
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("INSERT OR IGNORE INTO users (username, password) VALUES (?, ?)",
-                         (username, password))
-        await db.commit()
+    async with db.write() as conn:
+        await conn.execute("INSERT OR IGNORE INTO users (username, password) VALUES (?, ?)",
+                           (username, password))
+
+
+_POSTS_CHANGED_AT = '''(SELECT MAX(changed_at) FROM (
+                    SELECT MAX(updated_at) AS changed_at FROM blogposts
+                    UNION ALL SELECT changed_at FROM content_changes WHERE scope = 'posts'
+                ))'''
+
+
+async def _mark_deleted(conn, scope):
+    await conn.execute('''
+        INSERT INTO content_changes (scope, changed_at) VALUES (?, ?)
+        ON CONFLICT (scope) DO UPDATE SET changed_at = excluded.changed_at
+    ''', (scope, datetime.now().isoformat()))
+
+
+async def get_content_version(post_id=None, comments=True):
+    # Дешевий зліпок стану контенту: змінюється при будь-якій зміні постів
+    # або коментарів (усіх, або лише одного поста, якщо передано post_id).
+    # comments=False — лише пости (поля коментарів None)
+    # Час змін враховує й останнє видалення (content_changes). Для сторінки поста
+    # видалення будь-якого коментаря рахується зміною: видалення рідкісні
+    if not comments:
+        async with db.read() as conn:
+            async with conn.execute(f'SELECT {_POSTS_CHANGED_AT}, COUNT(*), NULL, NULL FROM blogposts') as cursor:
+                cursor.row_factory = ContentVersion.from_row
+                return await cursor.fetchone()
+    comments_filter = 'WHERE post_id = ?' if post_id is not None else ''
+    params = (post_id, post_id) if post_id is not None else ()
+    async with db.read() as conn:
+        async with conn.execute(f'''
+            SELECT
+                {_POSTS_CHANGED_AT},
+                (SELECT COUNT(*) FROM blogposts),
+                (SELECT MAX(changed_at) FROM (
+                    SELECT MAX(created_at) AS changed_at FROM comments {comments_filter}
+                    UNION ALL SELECT changed_at FROM content_changes WHERE scope = 'comments'
+                )),
+                (SELECT COUNT(*) FROM comments {comments_filter})
+        ''', params) as cursor:
+            cursor.row_factory = ContentVersion.from_row
+            return await cursor.fetchone()
+
+
+def username_key(username, key=None):
+    key = key or USER_LOOKUP_KEY
+    if not key:
+        raise RuntimeError("USER_LOOKUP_KEY is not set")
+    return hmac.new(key.encode(), username.encode(), hashlib.sha256).hexdigest()
+
+
+def _verify_password(password, password_hash):
+    if password_hash is None:
+        # Та сама робота, що й для справжньої перевірки: час відповіді не видає, чи існує логін
+        pwd_context.dummy_verify()
+        return False
+    return pwd_context.verify(password, password_hash)
+
+
+def _find_legacy_user(username, password, rows):
+    # Рядки без дійсного username_key: логін можна перевірити лише по кожному хешу окремо
+    for user_id, username_hash, password_hash in rows:
+        if pwd_context.verify(username, username_hash):
+            return user_id if pwd_context.verify(password, password_hash) else None
+    return None
 
 
 class User:
     @staticmethod
     async def authenticate(username, password):
-        async with aiosqlite.connect(DB_PATH) as db:
-            async with db.execute("SELECT username, password FROM users") as cursor:
-                async for row in cursor:
-                    if pwd_context.verify(username, row[0]) and pwd_context.verify(password, row[1]):
-                        return True
-        return False
+        if not username or not password:
+            return False
+        key = username_key(username)
+        loop = asyncio.get_running_loop()
+        async with db.read() as conn:
+            async with conn.execute('SELECT password FROM users WHERE username_key = ?', (key,)) as cursor:
+                row = await cursor.fetchone()
+            if row is None:
+                # Рядки без ключа або з ключем від колишнього публічного значення за замовчуванням
+                # (SECRET_KEY): після успішного входу ключ перераховується з USER_LOOKUP_KEY
+                async with conn.execute(
+                        'SELECT id, username, password FROM users WHERE username_key IS NULL OR username_key = ?',
+                        (username_key(username, SECRET_KEY),)) as cursor:
+                    legacy_rows = await cursor.fetchall()
+        if row is not None or not legacy_rows:
+            return await loop.run_in_executor(_auth_executor, _verify_password, password, row and row[0])
+
+        user_id = await loop.run_in_executor(_auth_executor, _find_legacy_user, username, password, legacy_rows)
+        if user_id is None:
+            return False
+        async with db.write() as conn:
+            await conn.execute('UPDATE users SET username_key = ? WHERE id = ?', (key, user_id))
+        return True
 
 
 class BlogPost:
@@ -71,106 +436,479 @@ class BlogPost:
         self.tags = tags
 
     @staticmethod
-    async def create(title_uk, title_en, main_image, text_uk, text_en, tags):
-        async with aiosqlite.connect(DB_PATH) as db:
-            cursor = await db.execute('''
-                INSERT INTO blogposts (title_uk, title_en, main_image, publication_date, text_uk, text_en, tags)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (title_uk, title_en, main_image, datetime.now().isoformat(), text_uk, text_en, tags))
-            await db.commit()
-            return cursor.lastrowid
+    async def create(title_uk, title_en, main_image, text_uk, text_en, tags, main_image_variants=None):
+        now = datetime.now().isoformat()
+        async with db.write() as conn:
+            cursor = await conn.execute('''
+                INSERT INTO blogposts (title_uk, title_en, main_image, publication_date, text_uk, text_en, tags,
+                                       updated_at, main_image_variants)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (title_uk, title_en, main_image, now, text_uk, text_en, tags, now, main_image_variants))
+            await save_post_tags(conn, cursor.lastrowid, tags)
+            await save_search_index(conn, cursor.lastrowid, title_uk, title_en, text_uk, text_en)
+        notify_change('post_created', cursor.lastrowid)
+        return cursor.lastrowid
 
     @staticmethod
-    async def update(post_id, title_uk, title_en, main_image, text_uk, text_en, tags):
-        async with aiosqlite.connect(DB_PATH) as db:
-            await db.execute('''
+    async def update(post_id, title_uk, title_en, main_image, text_uk, text_en, tags, main_image_variants=None):
+        async with db.write() as conn:
+            await conn.execute('''
                 UPDATE blogposts
-                SET title_uk = ?, title_en = ?, main_image = ?, text_uk = ?, text_en = ?, tags = ?
+                SET title_uk = ?, title_en = ?, main_image = ?, text_uk = ?, text_en = ?, tags = ?, updated_at = ?,
+                    main_image_variants = ?
                 WHERE id = ?
-            ''', (title_uk, title_en, main_image, text_uk, text_en, tags, post_id))
-            await db.commit()
+            ''', (title_uk, title_en, main_image, text_uk, text_en, tags, datetime.now().isoformat(),
+                  main_image_variants, post_id))
+            await save_post_tags(conn, post_id, tags)
+            await save_search_index(conn, post_id, title_uk, title_en, text_uk, text_en)
+        notify_change('post_updated', post_id)
 
     @staticmethod
     async def delete(post_id):
-        async with aiosqlite.connect(DB_PATH) as db:
-            await db.execute('DELETE FROM blogposts WHERE id = ?', (post_id,))
-            await db.commit()
+        await BlogPost.delete_many([post_id])
+
+    @staticmethod
+    async def delete_many(post_ids):
+        # Видаляє кілька постів однією транзакцією; повертає id тих, що існували
+        ids = json.dumps([int(post_id) for post_id in post_ids])
+        async with db.write() as conn:
+            async with conn.execute(f'SELECT id FROM blogposts WHERE id IN {_JSON_IDS}', (ids,)) as cursor:
+                deleted = [row[0] for row in await cursor.fetchall()]
+            await conn.execute(f'DELETE FROM post_tags WHERE post_id IN {_JSON_IDS}', (ids,))
+            await conn.execute(f'DELETE FROM posts_fts WHERE rowid IN {_JSON_IDS}', (ids,))
+            await conn.execute(f'DELETE FROM blogposts WHERE id IN {_JSON_IDS}', (ids,))
+            if deleted:
+                await _mark_deleted(conn, 'posts')
+        for post_id in deleted:
+            notify_change('post_deleted', post_id)
+        return deleted
 
     @staticmethod
     async def get_all():
-        async with aiosqlite.connect(DB_PATH) as db:
-            cursor = await db.execute('SELECT * FROM blogposts ORDER BY publication_date DESC')
-            posts = await cursor.fetchall()
-            return posts
+        async with db.read() as conn:
+            async with conn.execute(f'SELECT {_columns(PostRow)} FROM blogposts ORDER BY publication_date DESC') as cursor:
+                cursor.row_factory = PostRow.from_row
+                return await cursor.fetchall()
+
+    @staticmethod
+    async def get_admin_page(before=None, limit=50):
+        # Сторінка списку в адмінці без текстів постів, від новіших до старіших.
+        # before — ключ (publication_date, id) останнього рядка попередньої сторінки.
+        # Повертає (рядки PostAdminItem, ключ наступної сторінки або None)
+        where, params = '', ()
+        if before is not None:
+            where, params = 'WHERE (publication_date, id) < (?, ?)', tuple(before)
+        async with db.read() as conn:
+            async with conn.execute(f'''
+                SELECT {_columns(PostAdminItem)} FROM blogposts
+                {where}
+                ORDER BY publication_date DESC, id DESC
+                LIMIT ?
+            ''', params + (limit + 1,)) as cursor:
+                cursor.row_factory = PostAdminItem.from_row
+                rows = await cursor.fetchall()
+        return _keyset_page(rows, limit, lambda row: (row.publication_date, row.id))
 
     @staticmethod
     async def get_by_id(post_id):
-        async with aiosqlite.connect(DB_PATH) as db:
-            cursor = await db.execute('SELECT * FROM blogposts WHERE id = ?', (post_id,))
-            post = await cursor.fetchone()
-            return post
+        async with db.read() as conn:
+            async with conn.execute(f'SELECT {_columns(PostRow)} FROM blogposts WHERE id = ?', (post_id,)) as cursor:
+                cursor.row_factory = PostRow.from_row
+                return await cursor.fetchone()
 
     @staticmethod
-    async def get_by_tag(tag):
-        async with aiosqlite.connect(DB_PATH) as db:
-            cursor = await db.execute('SELECT * FROM blogposts WHERE tags LIKE ?', ('%' + tag + '%',))
-            posts = await cursor.fetchall()
-            return posts
+    async def get_detail(post_id, lang):
+        # PostDetail з полями мови lang або None
+        lang = 'uk' if lang == 'uk' else 'en'
+        async with db.read() as conn:
+            async with conn.execute(f'''
+                SELECT id, title_{lang}, main_image, publication_date, text_{lang}, tags, main_image_variants
+                FROM blogposts WHERE id = ?
+            ''', (post_id,)) as cursor:
+                cursor.row_factory = PostDetail.from_row
+                return await cursor.fetchone()
 
     @staticmethod
-    async def get_navigation_posts(post_id):
-        posts = await BlogPost.get_all()
-        post_ids = [p[0] for p in posts]
+    async def exists(post_id):
+        async with db.read() as conn:
+            async with conn.execute('SELECT 1 FROM blogposts WHERE id = ?', (post_id,)) as cursor:
+                return await cursor.fetchone() is not None
 
-        try:
-            current_index = post_ids.index(int(post_id))
-        except ValueError:
-            return None, None
+    @staticmethod
+    async def get_by_tag(tag):
+        async with db.read() as conn:
+            async with conn.execute(f'''
+                SELECT {_columns(PostSummary, 'b.')} FROM post_tags t
+                JOIN blogposts b ON b.id = t.post_id
+                WHERE t.tag = ?
+                ORDER BY b.publication_date DESC
+            ''', (tag,)) as cursor:
+                cursor.row_factory = PostSummary.from_row
+                return await cursor.fetchall()
 
-        next_post = posts[current_index - 1] if current_index > 0 else None
-        prev_post = posts[current_index + 1] if current_index < len(posts) - 1 else None
+    @staticmethod
+    async def get_tag_counts():
+        async with db.read() as conn:
+            async with conn.execute('''
+                SELECT tag, COUNT(*) FROM post_tags
+                GROUP BY tag
+                ORDER BY COUNT(*) DESC, tag
+            ''') as cursor:
+                cursor.row_factory = TagCount.from_row
+                return await cursor.fetchall()
+
+    @staticmethod
+    async def get_page(tag=None, page=1, per_page=2):
+        # Повертає сторінку постів (PostListItem, без текстів) і загальну кількість постів
+        where = ''
+        params = ()
+        if tag:
+            where = 'WHERE id IN (SELECT post_id FROM post_tags WHERE tag = ?)'
+            params = (tag,)
+        offset = (max(page, 1) - 1) * per_page
+        async with db.read() as conn:
+            async with conn.execute(f'SELECT COUNT(*) FROM blogposts {where}', params) as cursor:
+                total = (await cursor.fetchone())[0]
+            # Спершу обмежуємо сторінку, а коментарі рахуємо лише для її постів
+            async with conn.execute(f'''
+                SELECT {_columns(PostSummary, 'p.')}, COUNT(c.id)
+                FROM (
+                    SELECT {_columns(PostSummary)} FROM blogposts {where}
+                    ORDER BY publication_date DESC
+                    LIMIT ? OFFSET ?
+                ) p
+                LEFT JOIN comments c ON c.post_id = p.id
+                GROUP BY p.id
+                ORDER BY p.publication_date DESC
+            ''', params + (per_page, offset)) as cursor:
+                cursor.row_factory = PostListItem.from_row
+                posts = await cursor.fetchall()
+        return posts, total
 
+    @staticmethod
+    async def get_navigation_posts(post_id):
+        # Сусідні пости за (publication_date, id): попередній — старіший, наступний — новіший
+        async with db.read() as conn:
+            async with conn.execute('SELECT publication_date, id FROM blogposts WHERE id = ?', (post_id,)) as cursor:
+                current = await cursor.fetchone()
+            if current is None:
+                return None, None
+            async with conn.execute('''
+                SELECT id, title_uk, title_en FROM blogposts
+                WHERE (publication_date, id) < (?, ?)
+                ORDER BY publication_date DESC, id DESC
+                LIMIT 1
+            ''', current) as cursor:
+                cursor.row_factory = PostLink.from_row
+                prev_post = await cursor.fetchone()
+            async with conn.execute('''
+                SELECT id, title_uk, title_en FROM blogposts
+                WHERE (publication_date, id) > (?, ?)
+                ORDER BY publication_date ASC, id ASC
+                LIMIT 1
+            ''', current) as cursor:
+                cursor.row_factory = PostLink.from_row
+                next_post = await cursor.fetchone()
         return prev_post, next_post
-    
+
     @staticmethod
     async def get_latest_posts(limit=2):
-        async with aiosqlite.connect(DB_PATH) as db:
-            async with db.execute("SELECT * FROM blogposts ORDER BY publication_date DESC LIMIT ?", (limit,)) as cursor:
+        async with db.read() as conn:
+            async with conn.execute(f'''
+                SELECT {_columns(PostSummary)} FROM blogposts
+                ORDER BY publication_date DESC
+                LIMIT ?
+            ''', (limit,)) as cursor:
+                cursor.row_factory = PostSummary.from_row
+                return await cursor.fetchall()
+
+    @staticmethod
+    async def count():
+        async with db.read() as conn:
+            async with conn.execute('SELECT COUNT(*) FROM blogposts') as cursor:
+                return (await cursor.fetchone())[0]
+
+    @staticmethod
+    async def get_feed(lang, limit=20):
+        # Найновіші пости мовою lang для стрічки новин (FeedEntry)
+        lang = 'uk' if lang == 'uk' else 'en'
+        async with db.read() as conn:
+            async with conn.execute(f'''
+                SELECT id, title_{lang}, text_{lang}, publication_date, updated_at, tags FROM blogposts
+                ORDER BY publication_date DESC
+                LIMIT ?
+            ''', (limit,)) as cursor:
+                cursor.row_factory = FeedEntry.from_row
                 return await cursor.fetchall()
 
+    @staticmethod
+    async def get_sitemap_page(page=1, per_page=50000):
+        # id і час зміни постів (SitemapEntry), сторінками по per_page. Порядок за
+        # updated_at, щоб читався лише покривний індекс, а не рядки з текстами постів
+        async with db.read() as conn:
+            async with conn.execute('''
+                SELECT id, updated_at FROM blogposts
+                ORDER BY updated_at, id
+                LIMIT ? OFFSET ?
+            ''', (per_page, (max(page, 1) - 1) * per_page)) as cursor:
+                cursor.row_factory = SitemapEntry.from_row
+                return await cursor.fetchall()
+
+    @staticmethod
+    async def search(query, lang, page=1, per_page=10):
+        # Повертає (рядки SearchResult, загальна кількість). У заголовку й фрагменті тексту
+        # знайдені слова обгорнуті позначками MARK_START/MARK_END.
+        # Заголовки важать більше за текст; шукаються лише поля мови сторінки.
+        match = search_query(query)
+        if not match:
+            return [], 0
+        if lang != 'uk':
+            lang = 'en'
+        title_col, body_col = (0, 2) if lang == 'uk' else (1, 3)
+        match = f'{{title_{lang} body_{lang}}} : ({match})'
+        async with db.read() as conn:
+            async with conn.execute('SELECT COUNT(*) FROM posts_fts WHERE posts_fts MATCH ?', (match,)) as cursor:
+                total = (await cursor.fetchone())[0]
+            if not total:
+                return [], 0
+            # Спершу ранжуються лише id; highlight()/snippet() рахуються тільки для
+            # рядків сторінки, а не для всіх збігів
+            async with conn.execute(f'''
+                SELECT b.id,
+                       highlight(posts_fts, {title_col}, :start, :end),
+                       snippet(posts_fts, {body_col}, :start, :end, '…', 24),
+                       b.publication_date, b.main_image
+                FROM (
+                    SELECT rowid AS id, bm25(posts_fts, 10.0, 10.0, 1.0, 1.0) AS score
+                    FROM posts_fts
+                    WHERE posts_fts MATCH :match
+                    ORDER BY score
+                    LIMIT :limit OFFSET :offset
+                ) AS hits
+                CROSS JOIN posts_fts ON posts_fts.rowid = hits.id
+                JOIN blogposts b ON b.id = hits.id
+                WHERE posts_fts MATCH :match
+                ORDER BY hits.score
+            ''', {'start': MARK_START, 'end': MARK_END, 'match': match,
+                  'limit': per_page, 'offset': (page - 1) * per_page}) as cursor:
+                cursor.row_factory = SearchResult.from_row
+                return await cursor.fetchall(), total
+
+
+class CommentNode:
+    # Коментар із вкладеними відповідями; поля такі ж, як у таблиці comments
+    __slots__ = ('id', 'post_id', 'name', 'message', 'parent_id', 'created_at', 'children')
+
+    def __init__(self, id, post_id, name, message, parent_id, created_at):
+        self.id = id
+        self.post_id = post_id
+        self.name = name
+        self.message = message
+        self.parent_id = parent_id
+        self.created_at = created_at
+        self.children = []
+
+
+def build_comment_tree(rows):
+    # Два лінійні проходи: спершу вузли за id, потім кожен чіпляється до батька.
+    # Відповіді на видалені коментарі стають коренями. Порядок у межах рівня — порядок рядків.
+    nodes = {row.id: CommentNode(*row) for row in rows}
+    roots = []
+    for node in nodes.values():
+        parent = nodes.get(node.parent_id) if node.parent_id else None
+        if parent is None or parent is node:
+            roots.append(node)
+        else:
+            parent.children.append(node)
+    return roots
+
 
 class Comment:
     @staticmethod
     async def create(post_id, name, message, parent_id=None):
-        async with aiosqlite.connect(DB_PATH) as db:
-            await db.execute('''
+        async with db.write() as conn:
+            await conn.execute('''
                 INSERT INTO comments (post_id, name, message, parent_id, created_at)
                 VALUES (?, ?, ?, ?, ?)
             ''', (post_id, name, message, parent_id, datetime.now().isoformat()))
-            await db.commit()
+        notify_change('comment_created', post_id)
 
     @staticmethod
     async def get_by_post_id(post_id):
-        async with aiosqlite.connect(DB_PATH) as db:
-            cursor = await db.execute('SELECT * FROM comments WHERE post_id = ? ORDER BY created_at ASC', (post_id,))
-            comments = await cursor.fetchall()
-            return comments
+        async with db.read() as conn:
+            async with conn.execute(f'''
+                SELECT {_columns(CommentRow)} FROM comments
+                WHERE post_id = ?
+                ORDER BY created_at ASC
+            ''', (post_id,)) as cursor:
+                cursor.row_factory = CommentRow.from_row
+                return await cursor.fetchall()
+
+    @staticmethod
+    async def get_tree(post_id):
+        # Повертає (коментарі верхнього рівня з відповідями в children, загальна кількість)
+        rows = await Comment.get_by_post_id(post_id)
+        return build_comment_tree(rows), len(rows)
 
     @staticmethod
     async def get_comment_count_by_post_id(post_id):
-        async with aiosqlite.connect(DB_PATH) as db:
-            async with db.execute("SELECT COUNT(*) FROM comments WHERE post_id = ?", (post_id,)) as cursor:
+        async with db.read() as conn:
+            async with conn.execute("SELECT COUNT(*) FROM comments WHERE post_id = ?", (post_id,)) as cursor:
                 row = await cursor.fetchone()
                 return row[0] if row else 0
 
     @staticmethod
     async def delete(comment_id):
-        async with aiosqlite.connect(DB_PATH) as db:
-            await db.execute("DELETE FROM comments WHERE id = ?", (comment_id,))
-            await db.commit()
+        await Comment.delete_many([comment_id])
+
+    @staticmethod
+    async def delete_many(comment_ids):
+        # Видаляє кілька коментарів однією транзакцією; повертає кількість видалених
+        ids = json.dumps([int(comment_id) for comment_id in comment_ids])
+        async with db.write() as conn:
+            async with conn.execute(f'SELECT DISTINCT post_id FROM comments WHERE id IN {_JSON_IDS}', (ids,)) as cursor:
+                post_ids = [row[0] for row in await cursor.fetchall()]
+            cursor = await conn.execute(f'DELETE FROM comments WHERE id IN {_JSON_IDS}', (ids,))
+            if post_ids:
+                await _mark_deleted(conn, 'comments')
+        for post_id in post_ids:
+            notify_change('comment_deleted', post_id)
+        return cursor.rowcount
+
+    @staticmethod
+    async def get_admin_page(before=None, limit=50):
+        # Як BlogPost.get_admin_page, ключ — (created_at, id).
+        # Рядки CommentAdminItem
+        where, params = '', ()
+        if before is not None:
+            where, params = 'WHERE (created_at, id) < (?, ?)', tuple(before)
+        async with db.read() as conn:
+            async with conn.execute(f'''
+                SELECT {_columns(CommentAdminItem)} FROM comments
+                {where}
+                ORDER BY created_at DESC, id DESC
+                LIMIT ?
+            ''', params + (limit + 1,)) as cursor:
+                cursor.row_factory = CommentAdminItem.from_row
+                rows = await cursor.fetchall()
+        return _keyset_page(rows, limit, lambda row: (row.created_at, row.id))
 
     @staticmethod
     async def get_all():
-        async with aiosqlite.connect(DB_PATH) as db:
-            async with db.execute("SELECT * FROM comments ORDER BY created_at DESC") as cursor:
+        async with db.read() as conn:
+            async with conn.execute(f"SELECT {_columns(CommentRow)} FROM comments ORDER BY created_at DESC") as cursor:
+                cursor.row_factory = CommentRow.from_row
                 return await cursor.fetchall()
+
+
+class Outbox:
+    @staticmethod
+    async def enqueue(sender, recipient, subject, body):
+        now = datetime.now().isoformat()
+        async with db.write() as conn:
+            cursor = await conn.execute('''
+                INSERT INTO outbox (sender, recipient, subject, body, next_attempt_at, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (sender, recipient, subject, body, now, now))
+            return cursor.lastrowid
+
+    @staticmethod
+    async def claim_due(limit=10, lease=300):
+        # Атомарно забирає листи, час яких настав, і відкладає їх на lease секунд,
+        # щоб інші воркери не відправили їх вдруге
+        now = datetime.now()
+        async with db.write() as conn:
+            async with conn.execute('''
+                UPDATE outbox
+                SET attempts = attempts + 1, next_attempt_at = ?
+                WHERE id IN (
+                    SELECT id FROM outbox
+                    WHERE status = 'pending' AND next_attempt_at <= ?
+                    ORDER BY next_attempt_at
+                    LIMIT ?
+                )
+                RETURNING id, sender, recipient, subject, body, attempts
+            ''', ((now + timedelta(seconds=lease)).isoformat(), now.isoformat(), limit)) as cursor:
+                cursor.row_factory = OutboxMessage.from_row
+                return await cursor.fetchall()
+
+    @staticmethod
+    async def mark_sent(message_id):
+        async with db.write() as conn:
+            await conn.execute(
+                "UPDATE outbox SET status = 'sent', sent_at = ?, last_error = NULL WHERE id = ?",
+                (datetime.now().isoformat(), message_id)
+            )
+
+    @staticmethod
+    async def mark_retry(message_id, error, delay):
+        next_attempt_at = (datetime.now() + timedelta(seconds=delay)).isoformat()
+        async with db.write() as conn:
+            await conn.execute(
+                "UPDATE outbox SET next_attempt_at = ?, last_error = ? WHERE id = ?",
+                (next_attempt_at, error, message_id)
+            )
+
+    @staticmethod
+    async def mark_failed(message_id, error):
+        async with db.write() as conn:
+            await conn.execute(
+                "UPDATE outbox SET status = 'failed', last_error = ? WHERE id = ?",
+                (error, message_id)
+            )
+
+
+class UserSession:
+    @staticmethod
+    async def get(sid, now):
+        # Повертає (data, expires_at) або None, якщо сесії немає чи вона прострочена
+        async with db.read() as conn:
+            async with conn.execute(
+                    'SELECT data, expires_at FROM sessions WHERE sid = ? AND expires_at > ?', (sid, now)) as cursor:
+                return await cursor.fetchone()
+
+    @staticmethod
+    async def save(sid, data, expires_at):
+        async with db.write() as conn:
+            await conn.execute('''
+                INSERT INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT (sid) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at
+            ''', (sid, data, expires_at))
+
+    @staticmethod
+    async def delete(sid):
+        async with db.write() as conn:
+            await conn.execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+    @staticmethod
+    async def delete_expired(now):
+        async with db.write() as conn:
+            cursor = await conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (now,))
+            return cursor.rowcount
+
+
+class LoginAttempt:
+    @staticmethod
+    async def hit(client, now, window, limit):
+        # Записує спробу, якщо за останні window секунд їх було менше limit. Інакше
+        # нічого не пише і повертає час найдавнішої спроби у вікні
+        async with db.write() as conn:
+            # Підрахунок і запис в одній транзакції запису: воркери не проскочать ліміт разом
+            await conn.execute('BEGIN IMMEDIATE')
+            await conn.execute('DELETE FROM login_attempts WHERE attempted_at <= ?', (now - window,))
+            async with conn.execute(
+                    'SELECT COUNT(*), MIN(attempted_at) FROM login_attempts WHERE client = ?', (client,)) as cursor:
+                count, oldest = await cursor.fetchone()
+            if count >= limit:
+                return oldest
+            await conn.execute('INSERT INTO login_attempts (client, attempted_at) VALUES (?, ?)', (client, now))
+            return None
+
+    @staticmethod
+    async def reset(client):
+        async with db.write() as conn:
+            await conn.execute('DELETE FROM login_attempts WHERE client = ?', (client,))
+
+
+# Назви запитів для метрик на Python < 3.11 (див. db._query_label)
+register_query_labels(sys.modules[__name__])
@@ -0,0 +1,25 @@
+import time
+from config import LOGIN_RATE_LIMIT, LOGIN_RATE_WINDOW
+from models import LoginAttempt
+
+
+class RateLimiter:
+    # Обмеження кількості спроб входу з одного ключа (IP-адреси) у ковзному вікні.
+    # Спроби зберігаються в таблиці login_attempts, тож ліміт спільний для всіх воркерів
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+
+    async def hit(self, key):
+        # Реєструє спробу; повертає 0, якщо її дозволено, інакше — секунди до наступної
+        now = time.time()
+        oldest = await LoginAttempt.hit(key, now, self.window, self.limit)
+        if oldest is None:
+            return 0
+        return self.window - (now - oldest)
+
+    async def reset(self, key):
+        await LoginAttempt.reset(key)
+
+
+login_limiter = RateLimiter(LOGIN_RATE_LIMIT, LOGIN_RATE_WINDOW)
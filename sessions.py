@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import time
+import uuid
+import ujson
+from cachetools import TTLCache
+from sanic_session import InMemorySessionInterface
+from sanic_session.base import BaseSessionInterface, SessionDict, get_request_container
+from config import SESSION_BACKEND, SESSION_EXPIRY, SESSION_CACHE_TTL, SESSION_SWEEP_INTERVAL
+from models import UserSession
+
+logger = logging.getLogger('sanic_app')
+
+# Запис-заглушка в кеші для sid, яких немає в базі
+_MISSING = (None, 0)
+
+
+class SQLiteSessionInterface(BaseSessionInterface):
+    # Сесії в таблиці sessions, тож вхід працює незалежно від того, який воркер
+    # відповідає. Прочитані сесії кешуються у воркері на SESSION_CACHE_TTL секунд:
+    # вихід на іншому воркері стає видимим тут не пізніше ніж через цей час.
+    # На відміну від базового класу, сесія пишеться в базу лише коли змінилася
+    # або минула половина її строку, а порожні сесії анонімів не пишуться взагалі.
+    def __init__(self, expiry=SESSION_EXPIRY, cache_ttl=SESSION_CACHE_TTL, cache_size=1024,
+                 cookie_name='session', prefix='', httponly=True, samesite='Lax', secure=False):
+        super().__init__(
+            expiry=expiry,
+            prefix=prefix,
+            cookie_name=cookie_name,
+            domain=None,
+            httponly=httponly,
+            sessioncookie=False,
+            samesite=samesite,
+            session_name='session',
+            secure=secure,
+        )
+        self._cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._sweeper = None
+
+    async def _load(self, sid):
+        entry = self._cache.get(sid)
+        if entry is None:
+            entry = await UserSession.get(sid, int(time.time())) or _MISSING
+            self._cache[sid] = entry
+        if entry[0] is None or entry[1] <= time.time():
+            return None
+        return entry
+
+    async def _get_value(self, prefix, sid):
+        entry = await self._load(sid)
+        return entry and entry[0]
+
+    async def _set_value(self, key, data):
+        expires_at = int(time.time()) + self.expiry
+        await UserSession.save(key, data, expires_at)
+        self._cache[key] = (data, expires_at)
+
+    async def _delete_key(self, key):
+        await UserSession.delete(key)
+        self._cache[key] = _MISSING
+
+    async def open(self, request):
+        sid = request.cookies.get(self.cookie_name)
+        entry = await self._load(self.prefix + sid) if sid else None
+        if entry is None:
+            # Невідомий sid від клієнта не перевикористовується
+            session = SessionDict(sid=uuid.uuid4().hex)
+            session.expires_at = None
+        else:
+            session = SessionDict(ujson.loads(entry[0]), sid=sid)
+            session.expires_at = entry[1]
+        get_request_container(request)[self.session_name] = session
+        return session
+
+    async def save(self, request, response):
+        session = get_request_container(request).get(self.session_name)
+        if session is None:
+            return
+        key = self.prefix + session.sid
+        if not session:
+            if session.expires_at is not None:
+                await self._delete_key(key)
+                self._delete_cookie(request, response)
+            return
+        stale = session.expires_at is None or session.expires_at - time.time() < self.expiry / 2
+        if session.modified or stale:
+            await self._set_value(key, ujson.dumps(dict(session)))
+            self._set_cookie_props(request, response)
+
+    async def sweep(self):
+        return await UserSession.delete_expired(int(time.time()))
+
+    async def _sweep_forever(self, interval):
+        while True:
+            try:
+                removed = await self.sweep()
+                if removed:
+                    logger.info(f"Removed {removed} expired sessions")
+            except Exception as e:
+                logger.error(f"Session sweep failed: {e}")
+            await asyncio.sleep(interval)
+
+    def start_sweeper(self, interval=SESSION_SWEEP_INTERVAL):
+        self._sweeper = asyncio.get_running_loop().create_task(self._sweep_forever(interval))
+
+    async def stop_sweeper(self):
+        if self._sweeper:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+
+def make_session_interface(name=SESSION_BACKEND):
+    if name == 'memory':
+        return InMemorySessionInterface(expiry=SESSION_EXPIRY)
+    return SQLiteSessionInterface()
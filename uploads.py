@@ -0,0 +1,116 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from PIL import Image, ImageOps, UnidentifiedImageError
+from config import UPLOAD_DIR, IMAGE_WIDTHS, UPLOAD_WORKERS
+
+# Формати, у яких зберігаються зменшені копії (решта конвертується в JPEG)
+RESIZABLE_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+
+_pool = None
+
+
+def get_pool():
+    # Пул потоків створюється при першому завантаженні у кожному воркері сервера.
+    # Процеси тут не підходять: воркери Sanic демонічні й не можуть мати дочірніх
+    # процесів, а Pillow відпускає GIL на декодуванні, масштабуванні й кодуванні.
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix='upload')
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False)
+        _pool = None
+
+
+def _write_once(path, write):
+    # Файли адресуються вмістом, тож наявний файл уже має потрібні байти
+    if os.path.exists(path):
+        return
+    tmp_path = f'{path}.{os.getpid()}-{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def _save_image(image, path, fmt):
+    def write(f):
+        if fmt == 'JPEG':
+            image.convert('RGB').save(f, 'JPEG', quality=85, optimize=True, progressive=True)
+        elif fmt == 'WEBP':
+            image.save(f, 'WEBP', quality=80, method=4)
+        else:
+            image.save(f, fmt, optimize=True)
+    _write_once(path, write)
+
+
+def process_upload(data, filename, upload_dir=UPLOAD_DIR, widths=IMAGE_WIDTHS):
+    # Виконується в пулі потоків: зберігає оригінал під іменем за SHA-256
+    # і, якщо це зображення, створює зменшені копії та WebP-версії.
+    os.makedirs(upload_dir, exist_ok=True)
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    ext = os.path.splitext(filename)[1].lower()
+    url_dir = '/' + upload_dir.strip('/')
+    original_name = digest + ext
+    _write_once(os.path.join(upload_dir, original_name), lambda f: f.write(data))
+    result = {'url': f'{url_dir}/{original_name}', 'variants': []}
+
+    try:
+        image = Image.open(BytesIO(data))
+        image.load()
+    except (UnidentifiedImageError, OSError):
+        return result
+    fmt = image.format if image.format in RESIZABLE_FORMATS else 'JPEG'
+    image = ImageOps.exif_transpose(image)
+    if fmt == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    result['width'], result['height'] = image.size
+
+    # Ширини більші за оригінал не генеруються, але найбільша копія завжди є
+    targets = sorted({min(width, image.width) for width in widths})
+    for width in targets:
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+        formats = [(fmt, RESIZABLE_FORMATS[fmt])]
+        if fmt != 'WEBP':
+            formats.append(('WEBP', 'webp'))
+        for variant_fmt, variant_ext in formats:
+            name = f'{digest}-{width}.{variant_ext}'
+            _save_image(resized, os.path.join(upload_dir, name), variant_fmt)
+            result['variants'].append({
+                'url': f'{url_dir}/{name}',
+                'width': width,
+                'type': f'image/{variant_ext.replace("jpg", "jpeg")}',
+            })
+    return result
+
+
+async def save_upload(file):
+    # Повертає (url оригіналу, JSON з набором варіантів або None)
+    if not file.name:
+        raise ValueError("The uploaded file does not have a name")
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(get_pool(), process_upload, file.body, file.name)
+    variants = json.dumps(result) if result['variants'] else None
+    return result['url'], variants
+
+
+def srcset(variants, webp=False):
+    # "url 480w, url 960w" для атрибута srcset; порожній рядок, якщо варіантів немає
+    if not variants:
+        return ''
+    if isinstance(variants, str):
+        variants = json.loads(variants)
+    return ', '.join(
+        f"{variant['url']} {variant['width']}w"
+        for variant in variants['variants']
+        if (variant['type'] == 'image/webp') == webp
+    )